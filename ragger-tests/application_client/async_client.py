@@ -0,0 +1,138 @@
+import asyncio
+import functools
+import inspect
+from concurrent.futures import Executor
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Protocol, Tuple, Union
+
+from .chunk_store import ChunkStore
+from .client import (CLA, P1, P2, MAX_APDU_LEN, ApduFrame, Chunks, InsType, StreamedParameter,
+                     Transaction, block_protocol, checked_chunk_size, link_parameters,
+                     pack_derivation_path, split_message, unpack_app_and_version,
+                     unpack_public_key)
+
+if TYPE_CHECKING:
+    from ragger.backend.interface import BackendInterface, RAPDU
+
+
+# Anything which can exchange APDUs without blocking the event loop
+class AsyncTransport(Protocol):
+    async def exchange(self, cla: int, ins: int, p1: int = 0, p2: int = 0,
+                       data: bytes = b"") -> "RAPDU":
+        ...
+
+
+# Adapts a synchronous ragger BackendInterface to AsyncTransport, by running
+# each exchange in an executor (the loop's default one if none is given).
+class BackendTransport:
+    def __init__(self, backend: "BackendInterface", executor: Optional[Executor] = None) -> None:
+        self.backend = backend
+        self.executor = executor
+        self.max_apdu_len = getattr(backend, "max_apdu_len", MAX_APDU_LEN)
+
+    async def exchange(self, cla: int, ins: int, p1: int = 0, p2: int = 0,
+                       data: bytes = b"") -> "RAPDU":
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(
+            self.backend.exchange, cla=cla, ins=ins, p1=p1, p2=p2, data=data))
+
+
+# Same interface as Client, with coroutines, so that a single event loop can
+# drive many devices or Speculos instances at once. Hashing the parameters
+# into blocks is run in the executor (the loop's default one if none is
+# given), as is each exchange of a synchronous backend.
+class AsyncClient:
+    def __init__(self, transport: Union[AsyncTransport, "BackendInterface"],
+                 use_block_protocol: bool = False, chunk_size: Optional[int] = None,
+                 chunk_store: Optional[ChunkStore] = None,
+                 executor: Optional[Executor] = None) -> None:
+        if not inspect.iscoroutinefunction(transport.exchange):
+            transport = BackendTransport(transport, executor)
+        self.transport = transport
+        self.executor = executor
+        self.max_apdu_len = getattr(transport, "max_apdu_len", MAX_APDU_LEN)
+        self.chunk_size = checked_chunk_size(chunk_size, self.max_apdu_len)
+        self.frame = ApduFrame(self.max_apdu_len)
+        self.chunk_store = chunk_store
+        self.set_use_block_protocol(use_block_protocol)
+
+    def set_use_block_protocol(self, v):
+        if v:
+            self.send_fn = self.send_with_blocks
+        else:
+            self.send_fn = self.send_chunks
+
+    async def get_app_and_version(self) -> Tuple[Tuple[int, int, int], str]:
+        response = await self.send_fn(cla=CLA,
+                                      ins=InsType.GET_VERSION,
+                                      p1=P1,
+                                      p2=P2,
+                                      payload=[b""])
+        return unpack_app_and_version(response)
+
+    async def get_public_key(self, path: str) -> Tuple[int, bytes, int, bytes]:
+        return await self.get_public_key_impl(InsType.GET_PUBLIC_KEY, path)
+
+    async def get_public_key_with_confirmation(self, path: str) -> Tuple[int, bytes, int, bytes]:
+        return await self.get_public_key_impl(InsType.VERIFY_ADDRESS, path)
+
+    async def get_public_key_impl(self, ins, path: str) -> Tuple[int, bytes, int, bytes]:
+        response = await self.send_fn(cla=CLA,
+                                      ins=ins,
+                                      p1=P1,
+                                      p2=P2,
+                                      payload=[pack_derivation_path(path)])
+        return unpack_public_key(response)
+
+    async def sign_tx(self, path: str, transaction: Transaction) -> bytes:
+        if isinstance(transaction, (bytes, bytearray, memoryview)):
+            tx_len = (len(transaction)).to_bytes(4, byteorder='little')
+            return await self.send_fn(cla=CLA,
+                                      ins=InsType.SIGN_TX,
+                                      p1=P1,
+                                      p2=P2,
+                                      payload=[tx_len + transaction, pack_derivation_path(path)])
+
+        with StreamedParameter(transaction, size_prefixed=True) as tx:
+            return await self.send_fn(cla=CLA,
+                                      ins=InsType.SIGN_TX,
+                                      p1=P1,
+                                      p2=P2,
+                                      payload=[tx, pack_derivation_path(path)])
+
+    async def send_chunks(self, cla, ins, p1, p2, payload: [bytes]) -> bytes:
+        payload = [bytes(item) if isinstance(item, StreamedParameter) else item for item in payload]
+        message = payload[0] if len(payload) == 1 else b''.join(payload)
+        messages = split_message(message, MAX_APDU_LEN) or [b'']
+
+        result = b''
+        for msg in messages:
+            rapdu = await self.transport.exchange(cla=cla, ins=ins, p1=p1, p2=p2, data=msg)
+            result = rapdu.data
+        return result
+
+    # Block Protocol
+    #
+    # With on_result, each fragment of the result is passed to it as it
+    # arrives rather than collected, and the empty result is returned.
+    async def send_with_blocks(self, cla, ins, p1, p2, payload: [bytes],
+                               extra_data: Dict[str, bytes] = {},
+                               on_result: Optional[Callable[[bytes], None]] = None) -> bytes:
+        store = self.chunk_store if self.chunk_store is not None else ChunkStore(max_bytes=None)
+        loop = asyncio.get_running_loop()
+        with store.session() as chunks:
+            initialPayload, streams = await loop.run_in_executor(self.executor, functools.partial(
+                link_parameters, payload, chunks, extra_data, self.chunk_size))
+            return await self.handle_block_protocol(cla, ins, p1, p2, initialPayload, chunks,
+                                                    streams, on_result)
+
+    async def handle_block_protocol(self, cla, ins, p1, p2, initialPayload: bytes,
+                                    chunks: Chunks, streams: List[StreamedParameter] = [],
+                                    on_result: Optional[Callable[[bytes], None]] = None) -> bytes:
+        protocol = block_protocol(self.frame, initialPayload, chunks, streams, on_result)
+        payload = next(protocol)
+        try:
+            while True:
+                rapdu = await self.transport.exchange(cla=cla, ins=ins, p1=p1, p2=p2, data=payload)
+                payload = protocol.send(rapdu.data)
+        except StopIteration as done:
+            return done.value
@@ -0,0 +1,108 @@
+import mmap
+import os
+import sqlite3
+import tempfile
+import threading
+from typing import Dict, Optional, Protocol, Tuple
+
+
+# Where a ChunkStore moves blocks once it holds more than its memory budget.
+# Spilled blocks are kept until the spill is closed.
+class ChunkSpill(Protocol):
+    nbytes: int
+
+    def __contains__(self, digest: bytes) -> bool:
+        ...
+
+    def put(self, digest: bytes, block: bytes) -> None:
+        ...
+
+    def get(self, digest: bytes) -> Optional[bytes]:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+# Appends blocks to a file, read back through a memory map, with an in-memory
+# index of digest -> (offset, length). Uses a temporary file unless a path is
+# given.
+class MmapSpill:
+    def __init__(self, path: Optional[os.PathLike] = None) -> None:
+        if path is None:
+            self._file = tempfile.TemporaryFile()
+        else:
+            self._file = open(path, "w+b")
+        self._index: Dict[bytes, Tuple[int, int]] = {}
+        self._map: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+        self.nbytes = 0
+
+    def __contains__(self, digest: bytes) -> bool:
+        return digest in self._index
+
+    def put(self, digest: bytes, block: bytes) -> None:
+        with self._lock:
+            if digest in self._index:
+                return
+            self._file.seek(self.nbytes)
+            self._file.write(block)
+            self._index[digest] = (self.nbytes, len(block))
+            self.nbytes += len(block)
+
+    def get(self, digest: bytes) -> Optional[bytes]:
+        with self._lock:
+            location = self._index.get(digest)
+            if location is None:
+                return None
+            offset, length = location
+            # Map the file again once it has grown past the current mapping
+            if self._map is None or offset + length > len(self._map):
+                self._file.flush()
+                if self._map is not None:
+                    self._map.close()
+                self._map = mmap.mmap(self._file.fileno(), self.nbytes, access=mmap.ACCESS_READ)
+            return self._map[offset:offset + length]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._file.close()
+
+
+# Stores blocks in an SQLite database, indexed by digest. Uses a temporary
+# database unless a path is given.
+class SqliteSpill:
+    def __init__(self, path: Optional[os.PathLike] = None) -> None:
+        self._db = sqlite3.connect("" if path is None else path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute("CREATE TABLE IF NOT EXISTS chunks"
+                         " (digest BLOB PRIMARY KEY, block BLOB NOT NULL) WITHOUT ROWID")
+        self._lock = threading.Lock()
+        self.nbytes = self._db.execute(
+            "SELECT COALESCE(SUM(LENGTH(block)), 0) FROM chunks").fetchone()[0]
+
+    def __contains__(self, digest: bytes) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM chunks WHERE digest = ?", (digest,)).fetchone()
+        return row is not None
+
+    def put(self, digest: bytes, block: bytes) -> None:
+        with self._lock:
+            cursor = self._db.execute("INSERT OR IGNORE INTO chunks VALUES (?, ?)",
+                                      (digest, bytes(block)))
+            self.nbytes += len(block) if cursor.rowcount else 0
+
+    def get(self, digest: bytes) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute("SELECT block FROM chunks WHERE digest = ?",
+                                   (digest,)).fetchone()
+        return row[0] if row is not None else None
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.commit()
+            self._db.close()
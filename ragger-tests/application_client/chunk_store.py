@@ -0,0 +1,225 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from hashlib import sha256
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .chunk_spill import ChunkSpill
+
+HASH_LEN: int = 32
+NULL_HASH: bytes = b'\x00' * HASH_LEN
+
+
+@dataclass
+class ChunkStoreCounters:
+    hits: int = 0
+    misses: int = 0
+    # Hits served from the spill, included in hits
+    spill_hits: int = 0
+    spills: int = 0
+    bytes_spilled: int = 0
+
+
+# Content addressed storage for the blocks of the block protocol, keyed by
+# their raw sha256 digest, which Clients can share across calls.
+#
+# The hash chain of each parameter is memoised by the digest of its content,
+# so submitting the same bytes again (for instance when retrying a refused or
+# timed-out sign_tx) costs a single hashing pass instead of chaining it again.
+#
+# Parameters are hashed outside of the store's lock, which is only taken to
+# insert their blocks, so that calls linking in several threads do not wait
+# on each other.
+#
+# Once the store holds more than max_bytes, the least recently used blocks and
+# chains are evicted, except for those used by a call in progress. A store
+# without max_bytes is never trimmed.
+#
+# With a spill (see chunk_spill), blocks over the budget are moved there
+# instead, as soon as the budget is exceeded: nothing is evicted, and the
+# memory held stays bounded even when a single call stores a lot of data on
+# the host through PUT_CHUNK.
+class ChunkStore:
+    def __init__(self, max_bytes: Optional[int] = 64 << 20,
+                 spill: Optional[ChunkSpill] = None) -> None:
+        self.max_bytes = max_bytes
+        self.spill = spill
+        self.counters = ChunkStoreCounters()
+        self._blocks: "OrderedDict[bytes, bytes]" = OrderedDict()
+        # (parameter digest, chunk size) -> (head, digests of the blocks in order)
+        self._chains: "OrderedDict[Tuple[bytes, int], Tuple[bytes, List[bytes]]]" = OrderedDict()
+        self._pins: Dict[bytes, int] = {}
+        self._nbytes = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return digest in self._blocks or (self.spill is not None and digest in self.spill)
+
+    def __enter__(self) -> "ChunkStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.spill is not None:
+            self.spill.close()
+
+    # Bytes held in memory by the blocks and the memoised chains
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def session(self) -> "ChunkSession":
+        return ChunkSession(self)
+
+    def get(self, digest: bytes) -> Optional[bytes]:
+        with self._lock:
+            block = self._blocks.get(digest)
+            if block is not None:
+                self._blocks.move_to_end(digest)
+                self.counters.hits += 1
+                return block
+            if self.spill is not None:
+                block = self.spill.get(digest)
+                if block is not None:
+                    self.counters.hits += 1
+                    self.counters.spill_hits += 1
+                    return block
+            self.counters.misses += 1
+            return None
+
+    # Stores a block under a digest computed by the caller
+    def add(self, digest: bytes, block: bytes) -> None:
+        with self._lock:
+            self._add(digest, block)
+
+    def _add(self, digest: bytes, block: bytes) -> None:
+        if digest in self._blocks:
+            self._blocks.move_to_end(digest)
+        elif self.spill is None or digest not in self.spill:
+            self._blocks[digest] = block
+            self._nbytes += len(block)
+            if self.spill is not None and self.max_bytes is not None \
+               and self._nbytes > self.max_bytes:
+                self.trim()
+
+    def put(self, block: bytes) -> bytes:
+        digest = sha256(block).digest()
+        self.add(digest, block)
+        return digest
+
+    # Returns the hash of the first block of the parameter, and the digests of
+    # all its blocks. With pin, the blocks are pinned as they are inserted, and
+    # the caller unpins them once done.
+    def link(self, item: bytes, chunk_size: int, pin: bool = False) -> Tuple[bytes, List[bytes]]:
+        key = (sha256(item).digest(), chunk_size)
+        with self._lock:
+            chain = self._chains.get(key)
+            if chain is not None and all(digest in self for digest in chain[1]):
+                self._chains.move_to_end(key)
+                for digest in chain[1]:
+                    if digest in self._blocks:
+                        self._blocks.move_to_end(digest)
+                if pin:
+                    self.pin(chain[1])
+                return chain
+
+        view = memoryview(item)
+        last_hash = NULL_HASH
+        digests = []
+        for i in reversed(range(0, len(view), chunk_size)):
+            block = last_hash + view[i:i + chunk_size]
+            last_hash = sha256(block).digest()
+            with self._lock:
+                if pin:
+                    self.pin([last_hash])
+                self._add(last_hash, block)
+            digests.append(last_hash)
+        digests.reverse()
+        chain = (last_hash, digests)
+
+        with self._lock:
+            previous = self._chains.get(key)
+            if previous is not None:
+                self._nbytes -= HASH_LEN * len(previous[1])
+            self._chains[key] = chain
+            self._nbytes += HASH_LEN * len(digests)
+        return chain
+
+    def pin(self, digests: Iterable[bytes]) -> None:
+        with self._lock:
+            for digest in digests:
+                self._pins[digest] = self._pins.get(digest, 0) + 1
+
+    def unpin(self, digests: Iterable[bytes]) -> None:
+        with self._lock:
+            for digest in digests:
+                count = self._pins.pop(digest) - 1
+                if count:
+                    self._pins[digest] = count
+
+    def trim(self) -> None:
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            if self.spill is not None:
+                while self._blocks and self._nbytes > self.max_bytes:
+                    digest, block = self._blocks.popitem(last=False)
+                    self.spill.put(digest, block)
+                    self._nbytes -= len(block)
+                    self.counters.spills += 1
+                    self.counters.bytes_spilled += len(block)
+            else:
+                for digest in list(self._blocks):
+                    if self._nbytes <= self.max_bytes:
+                        break
+                    if digest not in self._pins:
+                        self._nbytes -= len(self._blocks.pop(digest))
+            # Chains whose blocks were evicted are linked again when used
+            while self._chains and self._nbytes > self.max_bytes:
+                _, (_, digests) = self._chains.popitem(last=False)
+                self._nbytes -= HASH_LEN * len(digests)
+
+
+# The view of a ChunkStore used by one block protocol call: the blocks it
+# links or receives stay pinned in the store until the session is closed.
+class ChunkSession:
+    def __init__(self, store: ChunkStore) -> None:
+        self.store = store
+        self._pinned: List[bytes] = []
+
+    def __enter__(self) -> "ChunkSession":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.store.unpin(self._pinned)
+        self._pinned = []
+        self.store.trim()
+
+    def get(self, digest: bytes) -> Optional[bytes]:
+        return self.store.get(digest)
+
+    def add(self, digest: bytes, block: bytes) -> None:
+        self.store.add(digest, block)
+        self._pin([digest])
+
+    def put(self, block: bytes) -> bytes:
+        digest = self.store.put(block)
+        self._pin([digest])
+        return digest
+
+    def link(self, item: bytes, chunk_size: int) -> Tuple[bytes, List[bytes]]:
+        chain = self.store.link(item, chunk_size, pin=True)
+        self._pinned.extend(chain[1])
+        return chain
+
+    def _pin(self, digests: List[bytes]) -> None:
+        self.store.pin(digests)
+        self._pinned.extend(digests)
@@ -0,0 +1,214 @@
+"""
+Signs a stream of transactions with the app, writing the signatures as they come.
+
+Run from the ragger-tests directory:
+
+    python -m application_client.cli INPUT OUTPUT [--format raw|records|jsonl]
+        [--path m/44'/535348'/0'] [--backend ledgercomm|speculos|simulator]
+
+INPUT is a file, or - for stdin, holding either one raw transaction (raw), a
+sequence of transactions each preceded by its 4 byte little endian length
+(records), or JSON lines each with the hex of a transaction under "tx" and
+optionally its path under "path" (jsonl). Files are memory mapped rather than
+read, and only the transaction being signed and the next one are held at a
+time.
+
+OUTPUT receives a JSON line per signature, with the index of the transaction,
+the input offset following it and the signature in hex. When OUTPUT already
+holds signatures, signing resumes after the last of them.
+"""
+import argparse
+import contextlib
+import json
+import mmap
+import os
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass
+from itertools import groupby
+from typing import BinaryIO, Deque, Iterator, Optional, Tuple, Union
+
+from .client import Client
+
+DEFAULT_PATH = "m/44'/535348'/0'"
+
+
+@dataclass
+class Record:
+    index: int
+    path: str
+    transaction: Union[bytes, memoryview, mmap.mmap]
+    # Input offset of the next record, to resume from
+    next_offset: int
+
+
+def read_records(source: Union[mmap.mmap, BinaryIO], offset: int, index: int,
+                 path: str) -> Iterator[Record]:
+    if isinstance(source, mmap.mmap):
+        view = memoryview(source)
+        while offset + 4 <= len(view):
+            size = int.from_bytes(view[offset:offset + 4], "little")
+            end = offset + 4 + size
+            if end > len(view):
+                raise ValueError(f"Truncated transaction at offset {offset}")
+            yield Record(index, path, view[offset + 4:end], end)
+            offset, index = end, index + 1
+    else:
+        while header := source.read(4):
+            size = int.from_bytes(header, "little")
+            transaction = source.read(size)
+            if len(header) != 4 or len(transaction) != size:
+                raise ValueError(f"Truncated transaction at offset {offset}")
+            offset += 4 + size
+            yield Record(index, path, transaction, offset)
+            index += 1
+
+
+def read_jsonl(source: BinaryIO, offset: int, index: int, path: str) -> Iterator[Record]:
+    for line in source:
+        offset += len(line)
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        yield Record(index, item.get("path", path), bytes.fromhex(item["tx"]), offset)
+        index += 1
+
+
+# The index and input offset to carry on from, after the last complete line
+# of a previous output. A line cut short by an interruption is dropped.
+def resume_point(output: str) -> Tuple[int, int]:
+    if not os.path.exists(output):
+        return 0, 0
+    index = offset = end = 0
+    with open(output, "r+b") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            item = json.loads(line)
+            index, offset = item["index"] + 1, item["next_offset"]
+            end += len(line)
+        f.truncate(end)
+    return index, offset
+
+
+def open_input(name: str, input_format: str,
+               offset: int) -> Tuple[Union[mmap.mmap, BinaryIO, None], object]:
+    if name == "-":
+        source = sys.stdin.buffer
+        # Skip what was already signed
+        while offset:
+            skipped = source.read(min(offset, 1 << 20))
+            if not skipped:
+                raise ValueError("The input ends before the offset to resume from")
+            offset -= len(skipped)
+        return source, None
+    f = open(name, "rb")
+    if input_format == "jsonl":
+        f.seek(offset)
+        return f, f
+    if os.fstat(f.fileno()).st_size == 0:
+        return None, f
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), f
+
+
+def open_backend(args):
+    if args.backend == "simulator":
+        from .simulator import SimulatedDevice
+        return contextlib.nullcontext(SimulatedDevice())
+
+    from ledgered.devices import Devices
+    device = Devices.get_by_name(args.device)
+    if args.backend == "speculos":
+        from ragger.backend import SpeculosBackend
+        return SpeculosBackend(args.elf, device=device, args=args.speculos_args.split())
+    from ragger.backend import LedgerCommBackend
+    return LedgerCommBackend(device=device, interface="hid")
+
+
+class Progress:
+    def __init__(self, interval: float = 1.0) -> None:
+        self.interval = interval
+        self.start = self.last = time.monotonic()
+        self.count = 0
+        self.nbytes = 0
+
+    def update(self, size: int) -> None:
+        self.count += 1
+        self.nbytes += size
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.report()
+
+    def report(self, end: str = "\r") -> None:
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        print(f"{self.count} signed, {self.nbytes / (1 << 20):.1f} MB, "
+              f"{self.count / elapsed:.1f} tx/s, {self.nbytes / (1 << 20) / elapsed:.2f} MB/s",
+              end=end, file=sys.stderr, flush=True)
+
+
+def sign_stream(client: Client, records: Iterator[Record], output,
+                progress: Optional[Progress] = None) -> int:
+    signed = 0
+    for path, group in groupby(records, key=lambda record: record.path):
+        in_flight: Deque[Record] = deque()
+
+        def transactions():
+            for record in group:
+                in_flight.append(record)
+                yield record.transaction
+
+        for signature in client.sign_many(path, transactions()):
+            record = in_flight.popleft()
+            output.write(json.dumps({"index": record.index, "next_offset": record.next_offset,
+                                     "signature": signature.hex()}) + "\n")
+            output.flush()
+            signed += 1
+            if progress is not None:
+                progress.update(len(record.transaction))
+    return signed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--format", choices=["raw", "records", "jsonl"], default="records")
+    parser.add_argument("--path", default=DEFAULT_PATH)
+    parser.add_argument("--backend", choices=["ledgercomm", "speculos", "simulator"],
+                        default="ledgercomm")
+    parser.add_argument("--device", default="nanosp")
+    parser.add_argument("--elf", help="app to run in Speculos")
+    parser.add_argument("--speculos-args", default="",
+                        help="extra Speculos arguments, e.g. an automation file")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+    if args.backend == "speculos" and args.elf is None:
+        parser.error("--elf is required with Speculos")
+    if args.format == "raw" and args.input == "-":
+        parser.error("raw input must be a file")
+
+    index, offset = resume_point(args.output)
+    source, f = open_input(args.input, args.format, offset)
+    if args.format == "raw":
+        transaction = source if source is not None else b""
+        records = iter([Record(0, args.path, transaction, len(transaction))] if index == 0 else [])
+    elif args.format == "records":
+        records = read_records(source, offset, index, args.path) if source is not None else iter([])
+    else:
+        records = read_jsonl(source, offset, index, args.path)
+
+    progress = None if args.quiet else Progress()
+    try:
+        with open_backend(args) as backend, open(args.output, "a") as output:
+            sign_stream(Client(backend, use_block_protocol=True), records, output, progress)
+    finally:
+        if progress is not None:
+            progress.report(end="\n")
+        if f is not None:
+            f.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,59 +1,81 @@
-from enum import IntEnum
-from typing import Dict, List, Optional, Tuple
-from hashlib import sha256
-from struct import unpack
-
-from ragger.backend.interface import BackendInterface, RAPDU
-from bip_utils import Bip32Utils
-
-
-MAX_APDU_LEN: int = 255
-
-CLA: int = 0x00
-P1: int = 0x00
-P2: int = 0x00
-
-class InsType(IntEnum):
-    GET_VERSION    = 0x00
-    GET_APP_NAME   = 0x00
-    VERIFY_ADDRESS = 0x01
-    GET_PUBLIC_KEY = 0x02
-    SIGN_TX        = 0x03
-
-class Errors(IntEnum):
-    SW_DENY                    = 0x6985
-    SW_WRONG_P1P2              = 0x6A86
-    SW_INS_NOT_SUPPORTED       = 0x6D00
-    SW_CLA_NOT_SUPPORTED       = 0x6E00
-    SW_WRONG_APDU_LENGTH       = 0x6E03
-    SW_WRONG_RESPONSE_LENGTH   = 0xB000
-    SW_DISPLAY_BIP32_PATH_FAIL = 0xB001
-    SW_DISPLAY_ADDRESS_FAIL    = 0xB002
-    SW_DISPLAY_AMOUNT_FAIL     = 0xB003
-    SW_WRONG_TX_LENGTH         = 0xB004
-    SW_TX_PARSING_FAIL         = 0xB005
-    SW_TX_HASH_FAIL            = 0xB006
-    SW_BAD_STATE               = 0xB007
-    SW_SIGNATURE_FAIL          = 0xB008
-
-
-def split_message(message: bytes, max_size: int) -> List[bytes]:
-    return [message[x:x + max_size] for x in range(0, len(message), max_size)]
+from collections import deque
+from typing import (TYPE_CHECKING, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional,
+                    Tuple, Union)
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextlib
+import mmap
+import os
+import time
+
+from . import core
+from .chunk_store import ChunkSession, ChunkStore
+# The protocol side lives in core, and is re-exported from here
+from .core import (CLA, HASH_LEN, INSTRUCTION_NAMES, MAX_APDU_LEN, P1, P2,
+                   ApduFrame, Chunks, Errors, HostToLedger, InlineEntry, InsType, LedgerToHost,
+                   MappingChunks, StreamedParameter, block_protocol, checked_chunk_size,
+                   inline_start, link_parameters, max_chunk_size, pack_derivation_path,
+                   pop_size_prefixed_buf_from_buf, pop_sized_buf_from_buffer, split_message,
+                   unpack_app_and_version, unpack_public_key)
+from .key_cache import PublicKeyCache
+from .metrics import BlockProtocolMetrics
+
+# Only for annotations: ragger.backend takes a long time to import
+if TYPE_CHECKING:
+    from ragger.backend.interface import BackendInterface, RAPDU
+
+# A transaction in memory, or one to stream from a file path, an mmap or a
+# seekable binary buffer
+Transaction = Union[bytes, str, os.PathLike, mmap.mmap, BinaryIO]
 
 
 class Client:
-    def __init__(self, backend: BackendInterface, use_block_protocol: bool=False) -> None:
+    # Public keys are looked up in key_cache first when one is given; device_id
+    # must then identify the device (or Speculos seed) the backend talks to.
+    # The keys are cached per app version, which is app_version when given,
+    # else the one the cache last saw on the device, and only asked to the
+    # device when neither is known. A client restarting with known keys then
+    # sends nothing to the device to get them. The version last seen is not
+    # checked again, so after the app is upgraded the caller must either pass
+    # app_version or clear what the cache knows of the device, with
+    # refresh_app_version or key_cache.forget_device.
+    #
+    # The block protocol chunk size defaults to the largest one the transport's
+    # maximum frame size allows, which backends may give as max_apdu_len.
+    #
+    # With an inline_threshold, parameters of at most that many bytes which fit
+    # in a single block are sent in a START_INLINE message. This is an opt-in
+    # for apps known to support it, which no version does yet (see
+    # docs/block-protocol.md): the others reject every call with an error.
+    #
+    # Blocks are kept in chunk_store across calls when one is given, instead of
+    # being rebuilt for every call.
+    def __init__(self, backend: "BackendInterface", use_block_protocol: bool=False,
+                 key_cache: Optional[PublicKeyCache] = None, device_id: Optional[str] = None,
+                 chunk_size: Optional[int] = None, inline_threshold: int = 0,
+                 chunk_store: Optional[ChunkStore] = None,
+                 metrics: Optional[BlockProtocolMetrics] = None,
+                 app_version: Optional[str] = None) -> None:
+        if key_cache is not None and device_id is None:
+            raise ValueError("A device_id is required to use a key_cache")
         self.backend = backend
-        if use_block_protocol:
-            self.send_fn = self.send_with_blocks
-        else:
-            self.send_fn = self.send_chunks
+        self.max_apdu_len = getattr(backend, "max_apdu_len", MAX_APDU_LEN)
+        self.chunk_size = checked_chunk_size(chunk_size, self.max_apdu_len)
+        self.frame = ApduFrame(self.max_apdu_len)
+        self.chunk_store = chunk_store
+        self.metrics = metrics
+        self.key_cache = key_cache
+        self.device_id = device_id
+        self._app_version = app_version
+        self.inline_threshold = inline_threshold
+        self.set_use_block_protocol(use_block_protocol)
 
     def set_use_block_protocol(self, v):
         if v:
             self.send_fn = self.send_with_blocks
+            self.stream_fn = self.stream_with_blocks
         else:
             self.send_fn = self.send_chunks
+            self.stream_fn = self.stream_chunks
 
     def get_app_and_version(self) -> Tuple[Tuple[int, int, int], str]:
         response = self.send_fn(cla=CLA,
@@ -61,12 +83,42 @@ class Client:
                             p1=P1,
                             p2=P2,
                             payload=[b""])
-        print(response)
-        major, minor, patch = unpack("BBB", response[:3])
-        return ((major, minor, patch), response[3:].decode("ascii"))
+        return unpack_app_and_version(response)
 
     def get_public_key(self, path: str) -> Tuple[int, bytes, int, bytes]:
-        return self.get_public_key_impl(InsType.GET_PUBLIC_KEY, path)
+        if self.key_cache is None:
+            return self.get_public_key_impl(InsType.GET_PUBLIC_KEY, path)
+
+        key = (self.device_id, self.app_version(), path)
+        cached = self.key_cache.get(key)
+        if cached is not None:
+            pub_key, chain_code = cached
+            return len(pub_key), pub_key, len(chain_code), chain_code
+        response = self.get_public_key_impl(InsType.GET_PUBLIC_KEY, path)
+        self.key_cache.put(key, response[1], response[3])
+        return response
+
+    def get_public_keys(self, paths: List[str]) -> List[Tuple[int, bytes, int, bytes]]:
+        return [self.get_public_key(path) for path in paths]
+
+    # Version of the app, as part of the key_cache keys
+    def app_version(self) -> str:
+        if self._app_version is None and self.key_cache is not None:
+            self._app_version = self.key_cache.app_version(self.device_id)
+        if self._app_version is None:
+            return self.refresh_app_version()
+        return self._app_version
+
+    # Asks the device for the version of its app again, and forgets the keys
+    # cached for it when the version changed
+    def refresh_app_version(self) -> str:
+        (major, minor, patch), name = self.get_app_and_version()
+        self._app_version = f"{name} {major}.{minor}.{patch}"
+        if self.key_cache is not None:
+            if self.key_cache.app_version(self.device_id) != self._app_version:
+                self.key_cache.forget_device(self.device_id)
+            self.key_cache.set_app_version(self.device_id, self._app_version)
+        return self._app_version
 
     def get_public_key_with_confirmation(self, path: str) -> Tuple[int, bytes, int, bytes]:
         return self.get_public_key_impl(InsType.VERIFY_ADDRESS, path)
@@ -78,25 +130,106 @@ class Client:
                                 p1=P1,
                                 p2=P2,
                                 payload=[pack_derivation_path(path)])
-        response, pub_key_len, pub_key = pop_size_prefixed_buf_from_buf(response)
-        response, chain_code_len, chain_code = pop_size_prefixed_buf_from_buf(response)
-        return pub_key_len, pub_key, chain_code_len, chain_code
-
-
-    def sign_tx(self, path: str, transaction: bytes) -> bytes:
-        tx_len = (len(transaction)).to_bytes(4, byteorder='little')
-        payload = [tx_len + transaction, pack_derivation_path(path)]
-        return self.send_fn(cla=CLA,
-                     ins=InsType.SIGN_TX,
-                     p1=P1,
-                     p2=P2,
-                     payload=payload)
-
-    def get_async_response(self) -> Optional[RAPDU]:
+        return unpack_public_key(response)
+
+
+    # The transaction can also be given as a file path, an mmap or a seekable
+    # binary buffer, in which case it is streamed from there.
+    def sign_tx(self, path: str, transaction: Transaction) -> bytes:
+        return b''.join(self.sign_tx_stream(path, transaction))
+
+    # Same as sign_tx, yielding the signature in the fragments the device
+    # sends it in, as they arrive
+    def sign_tx_stream(self, path: str, transaction: Transaction) -> Iterator[bytes]:
+        if isinstance(transaction, (bytes, bytearray, memoryview)):
+            tx_len = (len(transaction)).to_bytes(4, byteorder='little')
+            payload = [tx_len + transaction, pack_derivation_path(path)]
+            yield from self.stream_fn(cla=CLA,
+                                      ins=InsType.SIGN_TX,
+                                      p1=P1,
+                                      p2=P2,
+                                      payload=payload)
+            return
+
+        with StreamedParameter(transaction, size_prefixed=True) as tx:
+            yield from self.stream_fn(cla=CLA,
+                                      ins=InsType.SIGN_TX,
+                                      p1=P1,
+                                      p2=P2,
+                                      payload=[tx, pack_derivation_path(path)])
+
+    # Runs the app's parser test over params, a TestParsersSchema value
+    # encoded with schema.Encoder. Only built for the Nano devices.
+    def test_parsers(self, params: bytes) -> bytes:
+        return b''.join(self.test_parsers_stream(params))
+
+    def test_parsers_stream(self, params: bytes) -> Iterator[bytes]:
+        return self.stream_fn(cla=CLA,
+                              ins=InsType.TEST_PARSERS,
+                              p1=P1,
+                              p2=P2,
+                              payload=[params])
+
+    # Signs each of transactions with the key at path, yielding the signatures
+    # in order. With the block protocol, the parameters of the next
+    # transaction are chunked and hashed on a worker thread while the current
+    # one is exchanged, and the path is only packed once.
+    #
+    # Without a chunk_store, the blocks of each transaction go to a store of
+    # their own, dropped once it is signed, so that memory use does not grow
+    # with the batch.
+    def sign_many(self, path: str, transactions: Iterable[Transaction]) -> Iterator[bytes]:
+        if self.send_fn != self.send_with_blocks:
+            for transaction in transactions:
+                yield self.sign_tx(path, transaction)
+            return
+
+        packed_path = pack_derivation_path(path)
+
+        def prepare(transaction) -> Tuple[ChunkSession, bytes, List[StreamedParameter]]:
+            if isinstance(transaction, (bytes, bytearray, memoryview)):
+                tx_len = len(transaction).to_bytes(4, byteorder='little')
+                payload = [tx_len + transaction, packed_path]
+            else:
+                payload = [StreamedParameter(transaction, size_prefixed=True), packed_path]
+            store = self.chunk_store if self.chunk_store is not None else ChunkStore(max_bytes=None)
+            chunks = store.session()
+            initialPayload, streams = self.link_payload(payload, chunks)
+            return chunks, initialPayload, streams
+
+        def release(prepared: Future) -> None:
+            chunks, _, streams = prepared.result()
+            chunks.close()
+            for stream in streams:
+                stream.close()
+
+        pending = iter(transactions)
+        with ThreadPoolExecutor(max_workers=1) as worker:
+            transaction = next(pending, None)
+            prepared = worker.submit(prepare, transaction) if transaction is not None else None
+            try:
+                while prepared is not None:
+                    current = prepared
+                    chunks, initialPayload, streams = current.result()
+                    transaction = next(pending, None)
+                    prepared = None if transaction is None else worker.submit(prepare, transaction)
+                    try:
+                        signature = self.handle_block_protocol(CLA, InsType.SIGN_TX, P1, P2,
+                                                               initialPayload, chunks, streams)
+                    finally:
+                        release(current)
+                    yield signature
+            finally:
+                if prepared is not None:
+                    release(prepared)
+
+    def get_async_response(self) -> Optional["RAPDU"]:
         return self.backend.last_async_response
 
     def send_chunks(self, cla, ins, p1, p2, payload: [bytes]) -> bytes:
-        messages = split_message(b''.join(payload), MAX_APDU_LEN)
+        payload = [bytes(item) if isinstance(item, StreamedParameter) else item for item in payload]
+        message = payload[0] if len(payload) == 1 else b''.join(payload)
+        messages = split_message(message, MAX_APDU_LEN)
         if messages == []:
             messages = [b'']
 
@@ -114,107 +247,86 @@ class Client:
 
         return result
 
-    # Block Protocol
-    def send_with_blocks(self, cla, ins, p1, p2, payload: [bytes], extra_data: Dict[str, bytes] = {}) -> bytes:
-        chunk_size = 180
-        parameter_list = []
-
-        if not isinstance(payload, list):
-            payload = [payload]
-
-        data = {}
-
-        if extra_data:
-            data.update(extra_data)
-
-        for item in payload:
-            chunk_list = []
-            for i in range(0, len(item), chunk_size):
-                chunk = item[i:i + chunk_size]
-                chunk_list.append(chunk)
-
-            last_hash = b'\x00' * 32
-
-            for chunk in reversed(chunk_list):
-                linked_chunk = last_hash + chunk
-                last_hash = sha256(linked_chunk).digest()
-                data[last_hash.hex()] = linked_chunk
-
-            parameter_list.append(last_hash)
-
-        initialPayload = HostToLedger.START.to_bytes(1, byteorder='little') + b''.join(parameter_list)
-
-        return self.handle_block_protocol(cla, ins, p1, p2, initialPayload, data)
-
-    def handle_block_protocol(self, cla, ins, p1, p2, initialPayload: bytes, data: Dict[str, bytes]) -> bytes:
-        payload = initialPayload
-        rv_instruction = -1
-        result = b''
-
-        while (rv_instruction != LedgerToHost.RESULT_FINAL):
-            rapdu = self.backend.exchange(cla=cla,
-                                     ins=ins,
-                                     p1=p1,
-                                     p2=p2,
-                                     data=payload)
-            rv = rapdu.data
-            rv_instruction = rv[0]
-            rv_payload = rv[1:]
-
-            if rv_instruction == LedgerToHost.RESULT_ACCUMULATING:
-                result = result + rv_payload
-                payload = HostToLedger.RESULT_ACCUMULATING_RESPONSE.to_bytes(1, byteorder='little')
-            elif rv_instruction == LedgerToHost.RESULT_FINAL:
-                result = result + rv_payload
-            elif rv_instruction == LedgerToHost.GET_CHUNK:
-                chunk_hash = rv_payload.hex()
-                if chunk_hash in data:
-                    chunk = data[rv_payload.hex()]
-                    payload = HostToLedger.GET_CHUNK_RESPONSE_SUCCESS.to_bytes(1, byteorder='little') + chunk
-                else:
-                    payload = HostToLedger.GET_CHUNK_RESPONSE_FAILURE.to_bytes(1, byteorder='little')
-            elif rv_instruction == LedgerToHost.PUT_CHUNK:
-                data[sha256(rv_payload).hexdigest()] = rv_payload
-                payload = HostToLedger.PUT_CHUNK_RESPONSE.to_bytes(1, byteorder='little')
-            else:
-                raise RuntimeError("Unknown instruction returned from ledger")
-
-        return result
-
-class LedgerToHost(IntEnum):
-    RESULT_ACCUMULATING = 0
-    RESULT_FINAL = 1
-    GET_CHUNK = 2
-    PUT_CHUNK = 3
-
-class HostToLedger(IntEnum):
-    START = 0
-    GET_CHUNK_RESPONSE_SUCCESS = 1
-    GET_CHUNK_RESPONSE_FAILURE = 2
-    PUT_CHUNK_RESPONSE = 3
-    RESULT_ACCUMULATING_RESPONSE = 4
-
-def pack_derivation_path(derivation_path: str) -> bytes:
-    split = derivation_path.split("/")
-
-    if split[0] != "m":
-        raise ValueError("Error master expected")
-
-    path_bytes: bytes = (len(split) - 1).to_bytes(1, byteorder='little')
-    for value in split[1:]:
-        if value == "":
-            raise ValueError(f'Error missing value in split list "{split}"')
-        if value.endswith('\''):
-            path_bytes += Bip32Utils.HardenIndex(int(value[:-1])).to_bytes(4, byteorder='little')
-        else:
-            path_bytes += int(value).to_bytes(4, byteorder='little')
-    return path_bytes
-
-# remainder, data_len, data
-def pop_sized_buf_from_buffer(buffer:bytes, size:int) -> Tuple[bytes, bytes]:
-    return buffer[size:], buffer[0:size]
+    # Without the block protocol, the result comes in the last response
+    def stream_chunks(self, cla, ins, p1, p2, payload: [bytes]) -> Iterator[bytes]:
+        yield self.send_chunks(cla, ins, p1, p2, payload)
 
-# remainder, data_len, data
-def pop_size_prefixed_buf_from_buf(buffer:bytes) -> Tuple[bytes, int, bytes]:
-    data_len = buffer[0]
-    return buffer[1+data_len:], data_len, buffer[1:data_len+1]
+    # Block Protocol
+    #
+    # With on_result, each fragment of the result is passed to it as it
+    # arrives rather than collected, and the empty result is returned.
+    def send_with_blocks(self, cla, ins, p1, p2, payload: [bytes],
+                         extra_data: Dict[str, bytes] = {},
+                         on_result: Optional[Callable[[bytes], None]] = None) -> bytes:
+        with self.linked_parameters(payload, extra_data) as (chunks, initialPayload, streams):
+            return self.handle_block_protocol(cla, ins, p1, p2, initialPayload, chunks, streams,
+                                              on_result)
+
+    # Same as send_with_blocks, yielding the fragments of the result as they
+    # arrive, so that only one of them is held at a time
+    def stream_with_blocks(self, cla, ins, p1, p2, payload: [bytes],
+                           extra_data: Dict[str, bytes] = {}) -> Iterator[bytes]:
+        with self.linked_parameters(payload, extra_data) as (chunks, initialPayload, streams):
+            fragments: deque = deque()
+            protocol = block_protocol(self.frame, initialPayload, chunks, streams, fragments.append)
+            payload = next(protocol)
+            try:
+                while True:
+                    payload = protocol.send(self.block_exchange(cla, ins, p1, p2, payload).data)
+                    while fragments:
+                        yield fragments.popleft()
+            except StopIteration:
+                pass
+            while fragments:
+                yield fragments.popleft()
+
+    # Chunks the parameters of a call into a session of the chunk store, for
+    # as long as the call goes on
+    @contextlib.contextmanager
+    def linked_parameters(self, payload: [bytes], extra_data: Dict[str, bytes]
+                          ) -> Iterator[Tuple[ChunkSession, bytes, List[StreamedParameter]]]:
+        store = self.chunk_store if self.chunk_store is not None else ChunkStore(max_bytes=None)
+        with store.session() as chunks:
+            initialPayload, streams = self.link_payload(payload, chunks, extra_data)
+            yield chunks, initialPayload, streams
+
+    # Returns the START message of a call, as START_INLINE when enabled or START,
+    # along with the parameters which serve their own blocks
+    def link_payload(self, payload: [bytes], chunks: ChunkSession,
+                     extra_data: Dict[str, bytes] = {}) -> Tuple[bytes, List[StreamedParameter]]:
+        start = time.perf_counter()
+        initialPayload, streams = link_parameters(payload, chunks, extra_data, self.chunk_size,
+                                                  self.inline_threshold, self.max_apdu_len)
+        if self.metrics is not None:
+            self.metrics.observe_call(time.perf_counter() - start)
+        return initialPayload, streams
+
+    def handle_block_protocol(self, cla, ins, p1, p2, initialPayload: bytes,
+                              chunks: Chunks, streams: List[StreamedParameter] = [],
+                              on_result: Optional[Callable[[bytes], None]] = None) -> bytes:
+        return core.handle_block_protocol(self.block_exchange, cla, ins, p1, p2, initialPayload,
+                                          chunks, streams, on_result, self.frame)
+
+    def block_exchange(self, cla, ins, p1, p2, payload: bytes) -> "RAPDU":
+        if self.metrics is None:
+            return self.backend.exchange(cla=cla,
+                                         ins=ins,
+                                         p1=p1,
+                                         p2=p2,
+                                         data=payload)
+        return self.timed_exchange(cla, ins, p1, p2, payload)
+
+    def timed_exchange(self, cla, ins, p1, p2, payload: bytes) -> "RAPDU":
+        # Imported here so that only clients with metrics load ragger
+        from ragger.error import ExceptionRAPDU
+
+        start = time.perf_counter()
+        try:
+            rapdu = self.backend.exchange(cla=cla, ins=ins, p1=p1, p2=p2, data=payload)
+        except ExceptionRAPDU:
+            self.metrics.observe_error(len(payload))
+            raise
+        instruction = INSTRUCTION_NAMES.get(rapdu.data[0], "UNKNOWN") if rapdu.data else "EMPTY"
+        self.metrics.observe_exchange(instruction, time.perf_counter() - start, len(payload),
+                                      len(rapdu.data))
+        return rapdu
@@ -0,0 +1,400 @@
+"""
+The protocol side of the client, importing only the standard library.
+
+Holds the APDU constants and enums, derivation path packing, block chunking
+and the host side of the block protocol, so that short-lived processes can
+talk to the app without loading ragger or bip_utils. application_client.client
+builds the ragger Client on top of it and re-exports all of it.
+"""
+from enum import IntEnum
+from hashlib import sha256
+from struct import unpack
+from typing import (Any, BinaryIO, Callable, Dict, Generator, List, Mapping, MutableMapping,
+                    Optional, Tuple, Union)
+import functools
+import mmap
+import os
+
+from .chunk_store import ChunkSession, ChunkStore
+from .schema import Bip32Key, DArray, Encoder
+
+
+MAX_APDU_LEN: int = 255
+HASH_LEN: int = 32
+
+CLA: int = 0x00
+P1: int = 0x00
+P2: int = 0x00
+
+class InsType(IntEnum):
+    GET_VERSION    = 0x00
+    GET_APP_NAME   = 0x00
+    VERIFY_ADDRESS = 0x01
+    GET_PUBLIC_KEY = 0x02
+    SIGN_TX        = 0x03
+    TEST_PARSERS   = 0x20
+
+class Errors(IntEnum):
+    SW_DENY                    = 0x6985
+    SW_WRONG_P1P2              = 0x6A86
+    SW_INS_NOT_SUPPORTED       = 0x6D00
+    SW_CLA_NOT_SUPPORTED       = 0x6E00
+    SW_WRONG_APDU_LENGTH       = 0x6E03
+    SW_WRONG_RESPONSE_LENGTH   = 0xB000
+    SW_DISPLAY_BIP32_PATH_FAIL = 0xB001
+    SW_DISPLAY_ADDRESS_FAIL    = 0xB002
+    SW_DISPLAY_AMOUNT_FAIL     = 0xB003
+    SW_WRONG_TX_LENGTH         = 0xB004
+    SW_TX_PARSING_FAIL         = 0xB005
+    SW_TX_HASH_FAIL            = 0xB006
+    SW_BAD_STATE               = 0xB007
+    SW_SIGNATURE_FAIL          = 0xB008
+
+
+# Largest chunk of a parameter which fits in one GET_CHUNK_RESPONSE_SUCCESS:
+# the frame holds the HostToLedger byte, the hash of the next block and the data
+def max_chunk_size(max_apdu_len: int = MAX_APDU_LEN) -> int:
+    return max_apdu_len - 1 - HASH_LEN
+
+
+# Returns memoryview slices of message, so splitting does not copy it
+def split_message(message: bytes, max_size: int) -> List[memoryview]:
+    view = memoryview(message)
+    return [view[x:x + max_size] for x in range(0, len(view), max_size)]
+
+
+# A reusable buffer for outgoing APDU data: each message of the block protocol
+# is written in place into it, instead of being built by concatenating bytes.
+class ApduFrame:
+    def __init__(self, size: int = MAX_APDU_LEN) -> None:
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+
+    def build(self, instruction: int, data: bytes = b'') -> memoryview:
+        end = 1 + len(data)
+        self._view[0] = instruction
+        self._view[1:end] = data
+        return self._view[:end]
+
+
+# A block protocol parameter which is read lazily from a file path, an mmap or
+# any seekable binary buffer, instead of being held in memory.
+#
+# The hash chain is computed in one backward pass that keeps only the 32 byte
+# hash of each block, and the data of a block is re-read from the source when
+# the device asks for it, so memory use is O(number of chunks * 32 bytes).
+class StreamedParameter:
+    def __init__(self, source: Union[str, os.PathLike, mmap.mmap, BinaryIO],
+                 size_prefixed: bool = False) -> None:
+        self._owned = isinstance(source, (str, os.PathLike))
+        self._source = open(source, "rb") if self._owned else source
+        if isinstance(self._source, mmap.mmap):
+            self._size = len(self._source)
+        else:
+            self._size = self._source.seek(0, os.SEEK_END)
+        # SIGN_TX expects the transaction to be preceded by its 4 byte length
+        self._prefix = self._size.to_bytes(4, byteorder='little') if size_prefixed else b''
+        self._chunk_size = 0
+        self._hashes = bytearray()
+        self._next_index = 0
+
+    def __len__(self) -> int:
+        return len(self._prefix) + self._size
+
+    def __bytes__(self) -> bytes:
+        return self.read(0, len(self))
+
+    def __enter__(self) -> "StreamedParameter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._owned:
+            self._source.close()
+
+    def read(self, offset: int, size: int) -> bytes:
+        prefix_len = len(self._prefix)
+        head = self._prefix[offset:offset + size]
+        offset = max(offset - prefix_len, 0)
+        size -= len(head)
+        if size <= 0:
+            return head
+        if isinstance(self._source, mmap.mmap):
+            body = self._source[offset:offset + size]
+        else:
+            self._source.seek(offset)
+            body = self._source.read(size)
+        return head + body if head else body
+
+    # Returns the hash of the first block of the parameter
+    def link(self, chunk_size: int) -> bytes:
+        count = -(-len(self) // chunk_size)
+        self._chunk_size = chunk_size
+        self._hashes = bytearray(count * 32)
+        self._next_index = 0
+
+        last_hash = b'\x00' * 32
+        for i in reversed(range(count)):
+            hasher = sha256(last_hash)
+            hasher.update(self.read(i * chunk_size, chunk_size))
+            last_hash = hasher.digest()
+            self._hashes[i * 32:(i + 1) * 32] = last_hash
+        return last_hash
+
+    def get_chunk(self, chunk_hash: bytes) -> Optional[bytes]:
+        index = self._find(chunk_hash)
+        if index is None:
+            return None
+        self._next_index = index + 1
+        next_hash = self._hashes[(index + 1) * 32:(index + 2) * 32] or b'\x00' * 32
+        return bytes(next_hash) + self.read(index * self._chunk_size, self._chunk_size)
+
+    def _find(self, chunk_hash: bytes) -> Optional[int]:
+        # The device normally walks the chain front to back, so try the block
+        # after the last one served before scanning the whole list.
+        i = self._next_index
+        if self._hashes[i * 32:(i + 1) * 32] == chunk_hash:
+            return i
+        pos = self._hashes.find(chunk_hash)
+        while pos != -1:
+            if pos % 32 == 0:
+                return pos // 32
+            pos = self._hashes.find(chunk_hash, pos + 1)
+        return None
+
+
+def checked_chunk_size(chunk_size: Optional[int], max_apdu_len: int = MAX_APDU_LEN) -> int:
+    if chunk_size is None:
+        return max_chunk_size(max_apdu_len)
+    if not 0 < chunk_size <= max_chunk_size(max_apdu_len):
+        raise ValueError(f"Chunk size must be between 1 and {max_chunk_size(max_apdu_len)}")
+    return chunk_size
+
+
+# Chunks and chains every parameter of payload into chunks, and returns the
+# START message along with the parameters to stream from their source.
+#
+# With an inline_threshold, the START_INLINE message is returned instead, in
+# which parameters of at most inline_threshold bytes, fitting in a single
+# block, are sent directly, as long as the message fits in max_apdu_len.
+def link_parameters(payload: [bytes], chunks: ChunkSession, extra_data: Dict[str, bytes] = {},
+                    chunk_size: int = max_chunk_size(), inline_threshold: int = 0,
+                    max_apdu_len: int = MAX_APDU_LEN) -> Tuple[bytes, List[StreamedParameter]]:
+    parameter_list = []
+    first_blocks = []
+
+    if not isinstance(payload, list):
+        payload = [payload]
+
+    streams = []
+
+    for chunk_hash, chunk in extra_data.items():
+        chunks.add(bytes.fromhex(chunk_hash), chunk)
+
+    for item in payload:
+        if isinstance(item, StreamedParameter):
+            parameter_list.append(item.link(chunk_size))
+            first_blocks.append(None)
+            streams.append(item)
+            continue
+
+        head, digests = chunks.link(item, chunk_size)
+        parameter_list.append(head)
+        first_blocks.append(chunks.get(head) if len(digests) == 1 else None)
+
+    if inline_threshold:
+        return inline_start(parameter_list, first_blocks, inline_threshold, max_apdu_len), streams
+
+    initialPayload = HostToLedger.START.to_bytes(1, byteorder='little') + b''.join(parameter_list)
+    return initialPayload, streams
+
+
+# Only the data of inline blocks is sent: their next block hash is all zeros,
+# and the device puts it back to hash them.
+def inline_start(parameter_list: List[bytes], first_blocks: List[Optional[bytes]],
+                 inline_threshold: int, max_apdu_len: int = MAX_APDU_LEN) -> bytes:
+    # Start with every parameter sent as a hash, and inline them while they fit
+    size = 1 + (1 + HASH_LEN) * len(parameter_list)
+    entries = []
+    for block_hash, block in zip(parameter_list, first_blocks):
+        data = block[HASH_LEN:] if block is not None else None
+        if data is not None and len(data) <= inline_threshold \
+           and size - (1 + HASH_LEN) + 2 + len(data) <= max_apdu_len:
+            size += 2 + len(data) - (1 + HASH_LEN)
+            entries.append(bytes([InlineEntry.DATA, len(data)]) + data)
+        else:
+            entries.append(bytes([InlineEntry.HASH]) + block_hash)
+    return HostToLedger.START_INLINE.to_bytes(1, byteorder='little') + b''.join(entries)
+
+
+# Blocks by the hex of their hash, as callers of older versions of the client
+# kept them. The blocks the device puts are stored in them as they were then,
+# unless they are read-only.
+class MappingChunks:
+    def __init__(self, blocks: Mapping[str, bytes]) -> None:
+        self.blocks = blocks if isinstance(blocks, MutableMapping) else dict(blocks)
+
+    def get(self, digest: bytes) -> Optional[bytes]:
+        return self.blocks.get(digest.hex())
+
+    def put(self, block: bytes) -> bytes:
+        digest = sha256(block).digest()
+        self.blocks[digest.hex()] = block
+        return digest
+
+
+Chunks = Union[ChunkSession, Mapping[str, bytes]]
+
+
+def chunks_of(chunks: Chunks) -> Union[ChunkSession, MappingChunks]:
+    if isinstance(chunks, ChunkSession):
+        return chunks
+    if isinstance(chunks, Mapping):
+        return MappingChunks(chunks)
+    raise TypeError(f"Expected a ChunkSession or a mapping of blocks, not {type(chunks).__name__}")
+
+
+# The host side of the block protocol, independent of the transport: this
+# generator yields the data of each APDU to send, is sent back the data of the
+# response, and returns the result once the device sends RESULT_FINAL.
+#
+# With on_result, the fragments of the result from RESULT_ACCUMULATING and
+# RESULT_FINAL are passed to it instead, and the empty result is returned.
+def block_protocol(frame: ApduFrame, initialPayload: bytes, chunks: Chunks,
+                   streams: List[StreamedParameter] = [],
+                   on_result: Optional[Callable[[bytes], None]] = None
+                   ) -> Generator[bytes, bytes, bytes]:
+    chunks = chunks_of(chunks)
+    payload = initialPayload
+    rv_instruction = -1
+    result = bytearray()
+
+    while (rv_instruction != LedgerToHost.RESULT_FINAL):
+        rv = memoryview((yield payload))
+        rv_instruction = rv[0]
+        rv_payload = rv[1:]
+
+        if rv_instruction == LedgerToHost.RESULT_ACCUMULATING:
+            if on_result is None:
+                result += rv_payload
+            else:
+                on_result(bytes(rv_payload))
+            payload = frame.build(HostToLedger.RESULT_ACCUMULATING_RESPONSE)
+        elif rv_instruction == LedgerToHost.RESULT_FINAL:
+            if on_result is None:
+                result += rv_payload
+            elif rv_payload:
+                on_result(bytes(rv_payload))
+        elif rv_instruction == LedgerToHost.GET_CHUNK:
+            chunk = chunks.get(bytes(rv_payload))
+            for stream in streams:
+                if chunk is not None:
+                    break
+                chunk = stream.get_chunk(rv_payload)
+            if chunk is not None:
+                payload = frame.build(HostToLedger.GET_CHUNK_RESPONSE_SUCCESS, chunk)
+            else:
+                payload = frame.build(HostToLedger.GET_CHUNK_RESPONSE_FAILURE)
+        elif rv_instruction == LedgerToHost.PUT_CHUNK:
+            chunks.put(bytes(rv_payload))
+            payload = frame.build(HostToLedger.PUT_CHUNK_RESPONSE)
+        else:
+            raise RuntimeError("Unknown instruction returned from ledger")
+
+    return bytes(result)
+
+
+# The exchange method of a ragger backend, or anything called the same way
+# (cla, ins, p1, p2, data) and returning a response with its data in .data
+Exchange = Callable[..., Any]
+
+
+# Runs the block protocol with the device behind exchange, from the START
+# message to the result.
+def handle_block_protocol(exchange: Exchange, cla, ins, p1, p2, initialPayload: bytes,
+                          chunks: Chunks, streams: List[StreamedParameter] = [],
+                          on_result: Optional[Callable[[bytes], None]] = None,
+                          frame: Optional[ApduFrame] = None) -> bytes:
+    protocol = block_protocol(frame or ApduFrame(), initialPayload, chunks, streams, on_result)
+    payload = next(protocol)
+    try:
+        while True:
+            payload = protocol.send(exchange(cla, ins, p1, p2, payload).data)
+    except StopIteration as done:
+        return done.value
+
+
+def send_with_blocks(exchange: Exchange, cla, ins, p1, p2, payload: [bytes],
+                     chunk_size: Optional[int] = None,
+                     on_result: Optional[Callable[[bytes], None]] = None) -> bytes:
+    with ChunkStore(max_bytes=None).session() as chunks:
+        initialPayload, streams = link_parameters(payload, chunks,
+                                                  chunk_size=checked_chunk_size(chunk_size))
+        return handle_block_protocol(exchange, cla, ins, p1, p2, initialPayload, chunks, streams,
+                                     on_result)
+
+
+class LedgerToHost(IntEnum):
+    RESULT_ACCUMULATING = 0
+    RESULT_FINAL = 1
+    GET_CHUNK = 2
+    PUT_CHUNK = 3
+
+INSTRUCTION_NAMES = {instruction.value: instruction.name for instruction in LedgerToHost}
+
+class HostToLedger(IntEnum):
+    START = 0
+    GET_CHUNK_RESPONSE_SUCCESS = 1
+    GET_CHUNK_RESPONSE_FAILURE = 2
+    PUT_CHUNK_RESPONSE = 3
+    RESULT_ACCUMULATING_RESPONSE = 4
+    START_INLINE = 5
+
+# Tag of each parameter in START_INLINE
+class InlineEntry(IntEnum):
+    HASH = 0
+    DATA = 1
+
+# Bit set in hardened BIP32 indices
+HARDENED: int = 0x80000000
+
+# The app rejects paths longer than Bip32Key allows, which is left to it: the
+# host only needs the number of levels to fit in its byte
+_bip32_key = Encoder(DArray(Bip32Key.length, Bip32Key.item, 0xFF))
+
+@functools.lru_cache(maxsize=4096)
+def pack_derivation_path(derivation_path: str) -> bytes:
+    split = derivation_path.split("/")
+
+    if split[0] != "m":
+        raise ValueError("Error master expected")
+
+    indices: List[int] = []
+    for value in split[1:]:
+        if value == "":
+            raise ValueError(f'Error missing value in split list "{split}"')
+        if value.endswith('\''):
+            indices.append(int(value[:-1]) | HARDENED)
+        else:
+            indices.append(int(value))
+    return _bip32_key.encode(indices)
+
+def unpack_app_and_version(response: bytes) -> Tuple[Tuple[int, int, int], str]:
+    major, minor, patch = unpack("BBB", response[:3])
+    return ((major, minor, patch), response[3:].decode("ascii"))
+
+def unpack_public_key(response: bytes) -> Tuple[int, bytes, int, bytes]:
+    response, pub_key_len, pub_key = pop_size_prefixed_buf_from_buf(response)
+    response, chain_code_len, chain_code = pop_size_prefixed_buf_from_buf(response)
+    return pub_key_len, pub_key, chain_code_len, chain_code
+
+# remainder, data_len, data
+def pop_sized_buf_from_buffer(buffer:bytes, size:int) -> Tuple[bytes, bytes]:
+    return buffer[size:], buffer[0:size]
+
+# remainder, data_len, data
+def pop_size_prefixed_buf_from_buf(buffer:bytes) -> Tuple[bytes, int, bytes]:
+    data_len = buffer[0]
+    return buffer[1+data_len:], data_len, buffer[1:data_len+1]
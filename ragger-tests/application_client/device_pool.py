@@ -0,0 +1,194 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Deque, Iterable, List, Optional, Sequence, Tuple
+
+from ragger.error import ExceptionRAPDU
+
+from .client import Client
+
+
+@dataclass
+class DeviceStats:
+    jobs: int = 0
+    bytes_signed: int = 0
+    errors: int = 0
+    busy_seconds: float = 0.0
+    # Failures in a row, each of which takes the device out of rotation for
+    # longer, until it is retired
+    consecutive_errors: int = 0
+    retired: bool = False
+
+    @property
+    def jobs_per_second(self) -> float:
+        return self.jobs / self.busy_seconds if self.busy_seconds else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes_signed / self.busy_seconds if self.busy_seconds else 0.0
+
+
+def _job_size(transaction) -> int:
+    if isinstance(transaction, (str, os.PathLike)):
+        return os.path.getsize(transaction)
+    try:
+        return len(transaction)
+    except TypeError:
+        return 0
+
+
+@dataclass
+class _Job:
+    future: Future
+    path: str
+    transaction: Any
+    size: int
+    attempt: int = 0
+    failed_device: Optional[int] = None
+
+
+# Signs transactions on several devices at once.
+#
+# Jobs wait in a single queue, and each device has a worker thread taking the
+# next job whenever the device is idle, as a Client can only do one exchange
+# at a time: a faster device simply takes more jobs. A job failing with
+# anything other than a status word from the device (which would fail the
+# same way anywhere) goes back to the front of the queue for another device,
+# up to `retries` times.
+#
+# Such a failure also takes the device out of rotation for `backoff` seconds,
+# doubling with each failure in a row up to `max_backoff`, and the device is
+# retired after `max_failures` in a row. Once no device is left, the jobs
+# waiting and those submitted later fail.
+class DevicePool:
+    def __init__(self, clients: Sequence[Client], retries: int = 2, backoff: float = 0.5,
+                 max_backoff: float = 30.0, max_failures: int = 5) -> None:
+        if not clients:
+            raise ValueError("DevicePool needs at least one client")
+        self.clients = list(clients)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_failures = max_failures
+        self.stats = [DeviceStats() for _ in self.clients]
+        self._condition = threading.Condition()
+        self._pending: Deque[_Job] = deque()
+        # time.monotonic() at which each device is back in rotation
+        self._resume_at = [0.0] * len(self.clients)
+        self._running = 0
+        self._closed = False
+        self._workers = [threading.Thread(target=self._work, args=(i,), name=f"device-{i}",
+                                          daemon=True) for i in range(len(self.clients))]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self) -> "DevicePool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # Waits for the jobs already submitted
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def submit(self, path: str, transaction) -> Future:
+        job = _Job(Future(), path, transaction, _job_size(transaction))
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("DevicePool is closed")
+            if not self._active():
+                raise RuntimeError("Every device of the DevicePool is retired")
+            self._pending.append(job)
+            self._condition.notify_all()
+        return job.future
+
+    # Returns the signatures in the order the jobs were given. Jobs are taken
+    # from the iterable as the devices get to them, keeping about one waiting
+    # per device.
+    def sign_all(self, jobs: Iterable[Tuple[str, bytes]]) -> List[bytes]:
+        futures = []
+        for path, transaction in jobs:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._pending) < max(self._active(), 1))
+            futures.append(self.submit(path, transaction))
+        return [future.result() for future in futures]
+
+    def _active(self) -> int:
+        return sum(not stats.retired for stats in self.stats)
+
+    # The first job the device may take: any but those which just failed on
+    # it, unless it is the only device left
+    def _take(self, device: int) -> Optional[_Job]:
+        for job in self._pending:
+            if job.failed_device != device or self._active() == 1:
+                self._pending.remove(job)
+                return job
+        return None
+
+    def _work(self, device: int) -> None:
+        while True:
+            with self._condition:
+                while True:
+                    if self.stats[device].retired:
+                        return
+                    wait = self._resume_at[device] - time.monotonic()
+                    job = self._take(device) if wait <= 0 else None
+                    if job is not None:
+                        break
+                    # Jobs still running may come back to be retried
+                    if self._closed and not self._pending and not self._running:
+                        return
+                    self._condition.wait(timeout=wait if wait > 0 else None)
+                self._running += 1
+                self._condition.notify_all()
+            self._run(device, job)
+
+    def _run(self, device: int, job: _Job) -> None:
+        stats = self.stats[device]
+        start = time.perf_counter()
+        failed = False
+        error: Optional[Exception] = None
+        try:
+            signature = self.clients[device].sign_tx(job.path, job.transaction)
+        except ExceptionRAPDU as e:
+            error = e
+        except Exception as e:
+            error = e
+            failed = True
+        with self._condition:
+            stats.busy_seconds += time.perf_counter() - start
+            if not failed:
+                stats.consecutive_errors = 0
+                if error is None:
+                    stats.jobs += 1
+                    stats.bytes_signed += job.size
+                    job.future.set_result(signature)
+                else:
+                    job.future.set_exception(error)
+            else:
+                stats.errors += 1
+                stats.consecutive_errors += 1
+                if stats.consecutive_errors >= self.max_failures:
+                    stats.retired = True
+                else:
+                    backoff = self.backoff * 2 ** (stats.consecutive_errors - 1)
+                    self._resume_at[device] = time.monotonic() + min(backoff, self.max_backoff)
+                if job.attempt < self.retries and self._active():
+                    job.attempt += 1
+                    job.failed_device = device
+                    self._pending.appendleft(job)
+                else:
+                    job.future.set_exception(error)
+                if not self._active():
+                    while self._pending:
+                        self._pending.popleft().future.set_exception(error)
+            self._running -= 1
+            self._condition.notify_all()
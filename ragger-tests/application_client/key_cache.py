@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# (device identity, app version, derivation path)
+CacheKey = Tuple[str, str, str]
+
+
+# A bounded LRU cache of (public key, chain code) pairs, optionally persisted
+# to a JSON file so that known keys survive a restart.
+#
+# The app version last seen on each device is kept along with the keys, so
+# that a client restarting can look them up without asking the device. That
+# version is trusted until forget_device is called, e.g. after an upgrade.
+class PublicKeyCache:
+    def __init__(self, max_entries: int = 65536, path: Optional[os.PathLike] = None) -> None:
+        self.max_entries = max_entries
+        self.path = path
+        self._entries: "OrderedDict[CacheKey, Tuple[bytes, bytes]]" = OrderedDict()
+        self._versions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __enter__(self) -> "PublicKeyCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.path is not None:
+            self.save()
+
+    def get(self, key: CacheKey) -> Optional[Tuple[bytes, bytes]]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: CacheKey, pub_key: bytes, chain_code: bytes) -> None:
+        with self._lock:
+            self._entries[key] = (bytes(pub_key), bytes(chain_code))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def app_version(self, device: str) -> Optional[str]:
+        with self._lock:
+            return self._versions.get(device)
+
+    def set_app_version(self, device: str, version: str) -> None:
+        with self._lock:
+            self._versions[device] = version
+
+    # Drops the version last seen on the device and its keys
+    def forget_device(self, device: str) -> None:
+        with self._lock:
+            self._versions.pop(device, None)
+            for key in [key for key in self._entries if key[0] == device]:
+                del self._entries[key]
+
+    # Files written before the versions were kept hold the list of entries only
+    def load(self) -> None:
+        with open(self.path, "r") as f:
+            entries = json.load(f)
+        versions = {}
+        if isinstance(entries, dict):
+            versions, entries = entries["versions"], entries["keys"]
+        with self._lock:
+            self._versions.update(versions)
+            for device, version, path, pub_key, chain_code in entries:
+                self._entries[(device, version, path)] = (bytes.fromhex(pub_key),
+                                                          bytes.fromhex(chain_code))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # Least recently used entries first, so that loading keeps the LRU order
+    def save(self) -> None:
+        with self._lock:
+            entries = [[*key, pub_key.hex(), chain_code.hex()]
+                       for key, (pub_key, chain_code) in self._entries.items()]
+            versions = dict(self._versions)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"versions": versions, "keys": entries}, f)
+        os.replace(tmp_path, self.path)
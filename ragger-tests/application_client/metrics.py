@@ -0,0 +1,128 @@
+import json
+import math
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+# Upper bounds, in seconds, of the exchange latency histogram buckets. The
+# fastest are transport round trips, the slowest are waits for the user.
+LATENCY_BUCKETS: Tuple[float, ...] = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                                      0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+                                      math.inf)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[int]:
+        total = 0
+        out = []
+        for count in self.counts:
+            total += count
+            out.append(total)
+        return out
+
+
+# Metrics of the block protocol exchanges a Client makes, when passed one.
+#
+# Each exchange is timed from sending the command to receiving the response,
+# and filed under the instruction the device answered with: RESULT_FINAL
+# latencies include any time the user took to review, while GET_CHUNK ones are
+# mostly transport. Hashing is the time spent chunking and chaining the
+# parameters before START is sent. One instance may be shared by clients in
+# several threads.
+class BlockProtocolMetrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.latency: Dict[str, Histogram] = {}
+        self.calls = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.hash_seconds = 0.0
+
+    def observe_call(self, hash_seconds: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.hash_seconds += hash_seconds
+
+    def observe_exchange(self, instruction: str, seconds: float, sent: int, received: int) -> None:
+        with self._lock:
+            histogram = self.latency.get(instruction)
+            if histogram is None:
+                histogram = self.latency[instruction] = Histogram()
+            histogram.observe(seconds)
+            self.bytes_sent += sent
+            self.bytes_received += received
+
+    def observe_error(self, sent: int) -> None:
+        with self._lock:
+            self.errors += 1
+            self.bytes_sent += sent
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "hash_seconds": self.hash_seconds,
+                "exchanges": {
+                    instruction: {
+                        "count": histogram.count,
+                        "sum_seconds": histogram.sum,
+                        "buckets": {_bound(le): count for le, count
+                                    in zip(histogram.buckets, histogram.cumulative())},
+                    }
+                    for instruction, histogram in sorted(self.latency.items())
+                },
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    # Prometheus text exposition format
+    def to_prometheus(self, prefix: str = "alamgu_block_protocol") -> str:
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for suffix, labels, value in samples:
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+                lines.append(f"{prefix}_{name}{suffix}{{{label_text}}} {value}" if label_text
+                             else f"{prefix}_{name}{suffix} {value}")
+
+        latency = []
+        for instruction, exchanges in snapshot["exchanges"].items():
+            for le, count in exchanges["buckets"].items():
+                latency.append(("_bucket", [("instruction", instruction), ("le", le)], count))
+            latency.append(("_sum", [("instruction", instruction)], exchanges["sum_seconds"]))
+            latency.append(("_count", [("instruction", instruction)], exchanges["count"]))
+        metric("exchange_seconds", "histogram",
+               "Latency of exchanges, by the instruction the device answered with", latency)
+        metric("calls_total", "counter", "Block protocol calls", [("", [], snapshot["calls"])])
+        metric("errors_total", "counter", "Exchanges rejected by the device",
+               [("", [], snapshot["errors"])])
+        metric("bytes_total", "counter", "APDU data bytes", [
+            ("", [("direction", "sent")], snapshot["bytes_sent"]),
+            ("", [("direction", "received")], snapshot["bytes_received"]),
+        ])
+        metric("hash_seconds_total", "counter", "Time spent chunking and hashing parameters",
+               [("", [], snapshot["hash_seconds"])])
+        return "\n".join(lines) + "\n"
+
+
+def _bound(le: float) -> str:
+    return "+Inf" if le == math.inf else repr(le)
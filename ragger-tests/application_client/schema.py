@@ -0,0 +1,270 @@
+from dataclasses import dataclass
+from operator import itemgetter
+from struct import Struct
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+BIG: str = ">"
+LITTLE: str = "<"
+
+
+# The types of ledger-parser-combinators, as the app's schemas use them:
+#
+#     Byte               int
+#     Array(item, N)     bytes for Byte items, else a sequence of N values
+#     U16/U32/U64(e)     int, of the given endianness
+#     DArray(len, item, max)
+#                        the same as Array, of at most max items, preceded by
+#                        their number
+#     (a, b, ...)        a tuple of the values of each schema
+@dataclass(frozen=True)
+class Byte:
+    code = "B"
+    size = 1
+    endianness = None
+
+
+@dataclass(frozen=True)
+class U16:
+    endianness: str = LITTLE
+    code = "H"
+    size = 2
+
+
+@dataclass(frozen=True)
+class U32:
+    endianness: str = LITTLE
+    code = "I"
+    size = 4
+
+
+@dataclass(frozen=True)
+class U64:
+    endianness: str = LITTLE
+    code = "Q"
+    size = 8
+
+
+Number = Union[Byte, U16, U32, U64]
+
+
+@dataclass(frozen=True)
+class Array:
+    item: Number
+    length: int
+
+
+@dataclass(frozen=True)
+class DArray:
+    length: Number
+    item: "Schema"
+    max_length: int
+
+
+Schema = Union[Number, Array, DArray, tuple]
+
+
+def fixed_size(schema: Schema) -> Optional[int]:
+    if isinstance(schema, tuple):
+        sizes = [fixed_size(item) for item in schema]
+        return None if None in sizes else sum(sizes)
+    if isinstance(schema, Array):
+        return schema.item.size * schema.length
+    if isinstance(schema, DArray):
+        return None
+    return schema.size
+
+
+# A function writing a value of a schema to a bytearray
+Writer = Callable[[Any, bytearray], None]
+# A function taking a field out of the value being written
+Getter = Callable[[Any], Any]
+
+
+def _getter(path: Tuple[int, ...]) -> Getter:
+    if not path:
+        return lambda value: value
+    if len(path) == 1:
+        return itemgetter(path[0])
+    # The fields of the app's schemas are at most 3 deep
+    if len(path) == 2:
+        i, j = path
+        return lambda value: value[i][j]
+    if len(path) == 3:
+        i, j, k = path
+        return lambda value: value[i][j][k]
+
+    def get(value):
+        for index in path:
+            value = value[index]
+        return value
+    return get
+
+
+def _checked_bytes(get: Getter, length: int) -> Getter:
+    def checked(value):
+        data = get(value)
+        if len(data) != length:
+            raise ValueError(f"Expected {length} bytes")
+        return data
+    return checked
+
+
+def _pack_step(packer: Struct, fields: List[Tuple[Getter, bool]]) -> Writer:
+    # A field spread over several arguments is an array of numbers
+    if not any(spread for _, spread in fields):
+        getters = [get for get, _ in fields]
+        packed = packer.pack
+        # Runs of a single field are the most common ones
+        if len(getters) == 1:
+            get, = getters
+
+            def pack_one(value, out):
+                out += packed(get(value))
+            return pack_one
+
+        def pack(value, out):
+            out += packed(*[get(value) for get in getters])
+        return pack
+
+    def pack_spread(value, out):
+        args = []
+        for get, spread in fields:
+            if spread:
+                args.extend(get(value))
+            else:
+                args.append(get(value))
+        out += packer.pack(*args)
+    return pack_spread
+
+
+def _darray_step(schema: "DArray", get: Getter) -> Writer:
+    length = Struct((schema.length.endianness or LITTLE) + schema.length.code)
+    max_length = schema.max_length
+
+    def items_of(value):
+        items = get(value)
+        if len(items) > max_length:
+            raise ValueError(f"More than {max_length} items")
+        return items
+
+    if isinstance(schema.item, Byte):
+        def write_bytes(value, out):
+            items = items_of(value)
+            out += length.pack(len(items))
+            out += items
+        return write_bytes
+
+    if isinstance(schema.item, (U16, U32, U64)):
+        # One Struct for each number of items, made the first time
+        packers: Dict[int, Struct] = {}
+        item_format = schema.item.endianness + "%d" + schema.item.code
+
+        def write_numbers(value, out):
+            items = items_of(value)
+            out += length.pack(len(items))
+            packer = packers.get(len(items))
+            if packer is None:
+                packer = packers[len(items)] = Struct(item_format % len(items))
+            out += packer.pack(*items)
+        return write_numbers
+
+    write_item = _Compiler().compile(schema.item)
+
+    def write_items(value, out):
+        items = items_of(value)
+        out += length.pack(len(items))
+        for item in items:
+            write_item(item, out)
+    return write_items
+
+
+# Compiles a schema into a writer, out of precompiled steps. Consecutive fixed
+# size fields of compatible endianness are written by a single Struct.
+class _Compiler:
+    def __init__(self) -> None:
+        self.steps: List[Writer] = []
+        # The fields waiting to be packed together
+        self.endianness: Optional[str] = None
+        self.codes: List[str] = []
+        self.fields: List[Tuple[Getter, bool]] = []
+
+    def flush(self) -> None:
+        if self.codes:
+            packer = Struct((self.endianness or LITTLE) + "".join(self.codes))
+            self.steps.append(_pack_step(packer, self.fields))
+        self.endianness = None
+        self.codes = []
+        self.fields = []
+
+    def field(self, endianness: Optional[str], code: str, get: Getter,
+              spread: bool = False) -> None:
+        if endianness is not None and self.endianness not in (None, endianness):
+            self.flush()
+        if endianness is not None:
+            self.endianness = endianness
+        self.codes.append(code)
+        self.fields.append((get, spread))
+
+    def add(self, schema: Schema, path: Tuple[int, ...]) -> None:
+        if isinstance(schema, tuple):
+            for i, item in enumerate(schema):
+                self.add(item, path + (i,))
+        elif isinstance(schema, Array):
+            if isinstance(schema.item, Byte):
+                self.field(None, f"{schema.length}s",
+                           _checked_bytes(_getter(path), schema.length))
+            else:
+                self.field(schema.item.endianness, f"{schema.length}{schema.item.code}",
+                           _getter(path), spread=True)
+        elif isinstance(schema, DArray):
+            self.flush()
+            self.steps.append(_darray_step(schema, _getter(path)))
+        else:
+            self.field(schema.endianness, schema.code, _getter(path))
+
+    def compile(self, schema: Schema) -> Writer:
+        self.add(schema, ())
+        self.flush()
+        steps = tuple(self.steps)
+        if len(steps) == 1:
+            return steps[0]
+
+        def write(value, out):
+            for step in steps:
+                step(value, out)
+        return write
+
+
+# A schema compiled once into a function packing its values, to encode many
+# of them without going field by field.
+class Encoder:
+    def __init__(self, schema: Schema) -> None:
+        self.schema = schema
+        self.size = fixed_size(schema)
+        self.write = _Compiler().compile(schema)
+
+    def encode(self, value) -> bytes:
+        out = bytearray()
+        self.write(value, out)
+        return bytes(out)
+
+    # The encodings of values one after the other, in a single buffer
+    def encode_many(self, values: Iterable) -> bytearray:
+        out = bytearray()
+        write = self.write
+        for value in values:
+            write(value, out)
+        return out
+
+
+# Schemas of the app, from rust-app/src/interface.rs
+Bip32Key = DArray(Byte(), U32(LITTLE), 10)
+SignPayload = DArray(U32(LITTLE), Byte(), 0xFFFFFFFF)
+
+# and from rust-app/src/test_parsers.rs
+BytesParams = (Byte(), Array(Byte(), 32))
+U16Params = (U16(BIG), U16(LITTLE))
+U32Params = (U32(BIG), U32(LITTLE))
+U64Params = (U64(BIG), U64(LITTLE))
+DArrayParams = (DArray(Byte(), Byte(), 24), DArray(Byte(), U32Params, 4))
+TestParsersSchema = ((BytesParams, U16Params), (U64Params, DArrayParams))
@@ -0,0 +1,270 @@
+import time
+from enum import IntEnum
+from hashlib import blake2b, sha256
+from pathlib import Path
+from typing import Generator, List, Optional, Tuple
+
+import tomli
+from ecdsa import SigningKey
+from ecdsa.curves import Ed25519
+from ragger.error import ExceptionRAPDU
+from ragger.utils import RAPDU
+
+from .client import (CLA, HASH_LEN, MAX_APDU_LEN, HostToLedger, InlineEntry, InsType, LedgerToHost,
+                     pack_derivation_path)
+from .schema import BIG, DArray, Schema, TestParsersSchema, fixed_size
+
+NULL_HASH: bytes = b'\x00' * HASH_LEN
+
+# Derivation paths must start with m/44'/535348'
+BIP32_PREFIX: Tuple[int, int] = (0x8000002C, 0x80082B34)
+MAX_BIP32_PATH_LEN: int = 10
+
+APP_NAME: str = "alamgu example"
+CARGO_TOML: Path = Path(__file__).parents[2] / "rust-app" / "Cargo.toml"
+
+
+# Status words the app rejects APDUs with
+class Status(IntEnum):
+    OK                = 0x9000
+    INVALID_PARAMETER = 0x6802
+    NOT_SUPPORTED     = 0x6808
+    UNKNOWN           = 0x6D00
+    BAD_INS           = 0x6E01
+    USER_CANCELLED    = 0x6E04
+
+
+class _Reject(Exception):
+    def __init__(self, status: int) -> None:
+        self.status = status
+
+
+def _app_version() -> Tuple[int, int, int]:
+    with open(CARGO_TOML, "rb") as f:
+        version = tomli.load(f)["package"]["version"]
+    major, minor, patch = map(int, version.split("."))
+    return major, minor, patch
+
+
+# Device side generators: each yields the data of a response to the host and
+# is sent back the data of the next APDU, like the app's futures are polled.
+Device = Generator[bytes, bytes, None]
+
+
+# A parameter of the block protocol, read front to back like the app's
+# ByteStream, fetching each block with GET_CHUNK and checking its hash.
+class _ByteStream:
+    def __init__(self, head: bytes, first_block: Optional[bytes] = None) -> None:
+        self._hash = head
+        self._block = first_block
+        self._offset = 0
+
+    def read(self, size: int) -> Generator[bytes, bytes, bytes]:
+        out = bytearray()
+        while len(out) < size:
+            if self._block is None or self._offset == len(self._block) - HASH_LEN:
+                if self._block is not None:
+                    self._hash = self._block[:HASH_LEN]
+                if self._hash == NULL_HASH:
+                    raise _Reject(Status.INVALID_PARAMETER)
+                self._block = yield from _get_chunk(self._hash)
+                self._offset = 0
+            start = HASH_LEN + self._offset
+            taken = self._block[start:start + size - len(out)]
+            out += taken
+            self._offset += len(taken)
+        return bytes(out)
+
+
+def _get_chunk(chunk_hash: bytes) -> Generator[bytes, bytes, bytes]:
+    reply = yield bytes([LedgerToHost.GET_CHUNK]) + chunk_hash
+    block = reply[1:]
+    if reply[0] != HostToLedger.GET_CHUNK_RESPONSE_SUCCESS or sha256(block).digest() != chunk_hash:
+        raise _Reject(Status.INVALID_PARAMETER)
+    return block
+
+
+# Reads a value of schema from param as the app's parsers do, only checking
+# the lengths of the DArrays.
+def _read_schema(param: _ByteStream, schema: Schema) -> Generator[bytes, bytes, None]:
+    if isinstance(schema, tuple):
+        for item in schema:
+            yield from _read_schema(param, item)
+    elif isinstance(schema, DArray):
+        length = int.from_bytes((yield from param.read(schema.length.size)),
+                                "big" if schema.length.endianness == BIG else "little")
+        if length > schema.max_length:
+            raise _Reject(Status.INVALID_PARAMETER)
+        size = fixed_size(schema.item)
+        if size is not None:
+            yield from param.read(length * size)
+        else:
+            for _ in range(length):
+                yield from _read_schema(param, schema.item)
+    else:
+        yield from param.read(fixed_size(schema))
+
+
+# In-process stand-in for a ragger backend talking to the app, for fast host
+# side tests and benchmarks without building the app or running Speculos.
+#
+# It implements the device side of the block protocol as the app does, along
+# with GET_VERSION, GET_PUBKEY, VERIFY_ADDRESS, SIGN_TX and TEST_PARSERS. The
+# experimental START_INLINE extension, which no version of the app supports
+# yet, is only implemented with inline_params.
+# Keys are derived deterministically from the seed and the path, and
+# transactions are signed with Ed25519 over their blake2b-256 hash, so
+# signatures check out with utils.check_signature_validity; the keys are not
+# those of Speculos.
+#
+# Prompts are answered with `approve`, and `latency` seconds are spent in each
+# exchange to mimic a transport.
+class SimulatedDevice:
+    def __init__(self, seed: bytes = b"alamgu example simulator", latency: float = 0.0,
+                 blind_sign: bool = True, approve: bool = True, inline_params: bool = False,
+                 max_apdu_len: int = MAX_APDU_LEN) -> None:
+        self.seed = seed
+        self.latency = latency
+        self.blind_sign = blind_sign
+        self.approve = approve
+        self.inline_params = inline_params
+        self.max_apdu_len = max_apdu_len
+        self.version = _app_version() if CARGO_TOML.exists() else (0, 0, 0)
+        self.exchanges = 0
+        self.last_async_response: Optional[RAPDU] = None
+        self._device: Optional[Device] = None
+        self._keys = {}
+
+    def exchange(self, cla: int, ins: int, p1: int = 0, p2: int = 0, data: bytes = b"",
+                 tick_timeout: int = 0) -> RAPDU:
+        if self.latency:
+            time.sleep(self.latency)
+        self.exchanges += 1
+        data = bytes(data)
+        try:
+            if cla != CLA or p1 != 0 or p2 != 0:
+                raise _Reject(Status.BAD_INS)
+            if not data:
+                raise _Reject(Status.UNKNOWN)
+            if data[0] == HostToLedger.START_INLINE and not self.inline_params:
+                raise _Reject(Status.BAD_INS)
+            if data[0] in (HostToLedger.START, HostToLedger.START_INLINE):
+                self._device = self._start(ins, data)
+                response = next(self._device)
+            elif self._device is not None:
+                response = self._device.send(data)
+            else:
+                raise _Reject(Status.UNKNOWN)
+        except _Reject as e:
+            self._device = None
+            raise ExceptionRAPDU(e.status)
+        except StopIteration:
+            # The handler returned without sending a result
+            self._device = None
+            response = b""
+        if response[:1] == bytes([LedgerToHost.RESULT_FINAL]):
+            self._device = None
+        return RAPDU(Status.OK, response)
+
+    def public_key(self, path: str) -> bytes:
+        key = self._signing_key(self._parse_path(pack_derivation_path(path)))
+        return key.get_verifying_key().to_string()
+
+    def _start(self, ins: int, start: bytes) -> Device:
+        if ins == InsType.GET_VERSION:
+            major, minor, patch = self.version
+            yield from self._result_final(bytes([major, minor, patch]) + APP_NAME.encode("ascii"))
+        elif ins in (InsType.VERIFY_ADDRESS, InsType.GET_PUBLIC_KEY):
+            yield from self._get_address(start, prompt=ins == InsType.VERIFY_ADDRESS)
+        elif ins == InsType.SIGN_TX:
+            yield from self._sign(start)
+        elif ins == InsType.TEST_PARSERS:
+            yield from self._test_parsers(start)
+        else:
+            raise _Reject(Status.BAD_INS)
+
+    def _get_params(self, start: bytes, count: int) -> List[_ByteStream]:
+        params = []
+        if start[0] == HostToLedger.START:
+            hashes = start[1:]
+            if len(hashes) != count * HASH_LEN:
+                raise _Reject(Status.INVALID_PARAMETER)
+            params = [_ByteStream(hashes[i:i + HASH_LEN]) for i in range(0, len(hashes), HASH_LEN)]
+        else:
+            i = 1
+            while i < len(start):
+                if start[i] == InlineEntry.HASH:
+                    params.append(_ByteStream(start[i + 1:i + 1 + HASH_LEN]))
+                    i += 1 + HASH_LEN
+                elif start[i] == InlineEntry.DATA:
+                    block = bytes(HASH_LEN) + start[i + 2:i + 2 + start[i + 1]]
+                    params.append(_ByteStream(sha256(block).digest(), block))
+                    i += 2 + start[i + 1]
+                else:
+                    raise _Reject(Status.INVALID_PARAMETER)
+            if len(params) != count:
+                raise _Reject(Status.INVALID_PARAMETER)
+        return params
+
+    def _read_path(self, param: _ByteStream) -> Generator[bytes, bytes, Tuple[int, ...]]:
+        length = (yield from param.read(1))[0]
+        if length > MAX_BIP32_PATH_LEN:
+            raise _Reject(Status.INVALID_PARAMETER)
+        path = bytes([length]) + (yield from param.read(4 * length))
+        return self._parse_path(path)
+
+    @staticmethod
+    def _parse_path(packed: bytes) -> Tuple[int, ...]:
+        path = tuple(int.from_bytes(packed[i:i + 4], "little") for i in range(1, len(packed), 4))
+        if path[:2] != BIP32_PREFIX:
+            raise _Reject(Status.INVALID_PARAMETER)
+        return path
+
+    def _signing_key(self, path: Tuple[int, ...]) -> SigningKey:
+        key = self._keys.get(path)
+        if key is None:
+            secret = blake2b(b"".join(i.to_bytes(4, "little") for i in path), digest_size=32,
+                             key=self.seed[:64])
+            key = self._keys[path] = SigningKey.from_string(secret.digest(), curve=Ed25519)
+        return key
+
+    def _get_address(self, start: bytes, prompt: bool) -> Device:
+        param, = self._get_params(start, 1)
+        path = yield from self._read_path(param)
+        if prompt and not self.approve:
+            raise _Reject(Status.USER_CANCELLED)
+        public_key = self._signing_key(path).get_verifying_key().to_string()
+        # The address happens to be the public key
+        yield from self._result_final(bytes([len(public_key)]) + public_key
+                                      + bytes([len(public_key)]) + public_key)
+
+    def _sign(self, start: bytes) -> Device:
+        txn, path_param = self._get_params(start, 2)
+        length = int.from_bytes((yield from txn.read(4)), "little")
+        hasher = blake2b(digest_size=32)
+        while length:
+            data = yield from txn.read(min(length, 4096))
+            hasher.update(data)
+            length -= len(data)
+        path = yield from self._read_path(path_param)
+
+        if not self.blind_sign:
+            raise _Reject(Status.NOT_SUPPORTED)
+        if not self.approve:
+            raise _Reject(Status.USER_CANCELLED)
+        yield from self._result_final(self._signing_key(path).sign(hasher.digest()))
+
+    def _test_parsers(self, start: bytes) -> Device:
+        param, = self._get_params(start, 1)
+        yield from _read_schema(param, TestParsersSchema)
+        yield from self._result_final(b"")
+
+    # Results which do not fit in one response go through RESULT_ACCUMULATING
+    def _result_final(self, result: bytes) -> Device:
+        size = self.max_apdu_len - 1
+        while len(result) > size:
+            reply = yield bytes([LedgerToHost.RESULT_ACCUMULATING]) + result[:size]
+            if reply[:1] != bytes([HostToLedger.RESULT_ACCUMULATING_RESPONSE]):
+                raise _Reject(Status.INVALID_PARAMETER)
+            result = result[size:]
+        yield bytes([LedgerToHost.RESULT_FINAL]) + result
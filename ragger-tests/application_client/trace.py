@@ -0,0 +1,137 @@
+import os
+import struct
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, List, Optional, Union
+
+from ragger.backend.interface import BackendInterface, RAPDU
+from ragger.error import ExceptionRAPDU
+
+# A trace file is TRACE_MAGIC followed by one record per exchange: a
+# RECORD_HEADER with the times and the APDU fields, then the command data and
+# the response data.
+TRACE_MAGIC: bytes = b"ALMTRC\x00\x01"
+RECORD_HEADER = struct.Struct("<ddBBBBHII")
+
+STATUS_OK: int = 0x9000
+
+
+@dataclass(frozen=True)
+class TraceRecord:
+    # Seconds from the start of the trace to the command being sent
+    sent: float
+    # Seconds spent waiting for the response
+    duration: float
+    cla: int
+    ins: int
+    p1: int
+    p2: int
+    status: int
+    data: bytes
+    response: bytes
+
+
+def write_record(f: BinaryIO, record: TraceRecord) -> None:
+    f.write(RECORD_HEADER.pack(record.sent, record.duration, record.cla, record.ins, record.p1,
+                               record.p2, record.status, len(record.data), len(record.response)))
+    f.write(record.data)
+    f.write(record.response)
+
+
+def read_trace(path: Union[str, os.PathLike]) -> Iterator[TraceRecord]:
+    with open(path, "rb") as f:
+        if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(f"{path} is not an APDU trace")
+        while header := f.read(RECORD_HEADER.size):
+            if len(header) != RECORD_HEADER.size:
+                raise ValueError(f"{path} is truncated")
+            (sent, duration, cla, ins, p1, p2, status, data_len,
+             response_len) = RECORD_HEADER.unpack(header)
+            data = f.read(data_len)
+            response = f.read(response_len)
+            if len(data) != data_len or len(response) != response_len:
+                raise ValueError(f"{path} is truncated")
+            yield TraceRecord(sent, duration, cla, ins, p1, p2, status, data, response)
+
+
+# Wraps a backend and appends every exchange to a trace file, including those
+# the backend raises ExceptionRAPDU for. Everything but exchange is passed
+# through to the wrapped backend, so it can stand in for it anywhere.
+#
+# Each record is flushed once written, so that the trace can be read while it
+# is being recorded, and holds every exchange made before a crash.
+class RecordingBackend:
+    def __init__(self, backend: BackendInterface, path: Union[str, os.PathLike]) -> None:
+        self.backend = backend
+        self._file = open(path, "wb")
+        self._file.write(TRACE_MAGIC)
+        self._file.flush()
+        self._start = time.monotonic()
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    # Exchanges which fail without a status word, such as transport errors,
+    # are not recorded
+    def exchange(self, cla: int, ins: int, p1: int = 0, p2: int = 0, data: bytes = b"",
+                 **kwargs) -> RAPDU:
+        sent = time.monotonic()
+        try:
+            response = self.backend.exchange(cla, ins, p1, p2, data, **kwargs)
+        except ExceptionRAPDU as e:
+            self._record(sent, cla, ins, p1, p2, data, e.status, e.data or b"")
+            raise
+        self._record(sent, cla, ins, p1, p2, data, response.status, response.data)
+        return response
+
+    def _record(self, sent: float, cla: int, ins: int, p1: int, p2: int, data: bytes, status: int,
+                response: bytes) -> None:
+        write_record(self._file, TraceRecord(sent - self._start, time.monotonic() - sent, cla, ins,
+                                             p1, p2, status, bytes(data), bytes(response)))
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "RecordingBackend":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# Serves a recorded trace back, one record per exchange, checking that the
+# commands sent are those recorded. Responses come back as fast as possible,
+# or with realtime=True after the recorded device latency. Host time between
+# exchanges is not replayed, so changes to the host side show up when
+# benchmarking against a trace.
+class ReplayBackend:
+    def __init__(self, path: Union[str, os.PathLike], realtime: bool = False,
+                 max_apdu_len: Optional[int] = None) -> None:
+        self.records: List[TraceRecord] = list(read_trace(path))
+        self.realtime = realtime
+        self.position = 0
+        if max_apdu_len is not None:
+            self.max_apdu_len = max_apdu_len
+
+    def exchange(self, cla: int, ins: int, p1: int = 0, p2: int = 0, data: bytes = b"",
+                 **kwargs) -> RAPDU:
+        if self.position == len(self.records):
+            raise ValueError("The trace has no more exchanges")
+        record = self.records[self.position]
+        expected = (record.cla, record.ins, record.p1, record.p2, record.data)
+        if (cla, ins, p1, p2, bytes(data)) != expected:
+            raise ValueError(f"Exchange {self.position} does not match the trace")
+        self.position += 1
+        if self.realtime:
+            time.sleep(record.duration)
+        if record.status != STATUS_OK:
+            raise ExceptionRAPDU(record.status, record.response)
+        return RAPDU(record.status, record.response)
+
+    def rewind(self) -> None:
+        self.position = 0
+
+    @property
+    def done(self) -> bool:
+        return self.position == len(self.records)
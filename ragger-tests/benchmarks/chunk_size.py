@@ -0,0 +1,47 @@
+"""
+Reports the APDU exchanges per signed megabyte for a range of block protocol
+chunk sizes, up to the largest one a frame of MAX_APDU_LEN bytes allows.
+
+Run from the ragger-tests directory:
+
+    python -m benchmarks.chunk_size [--size-mb 1] [--chunk-sizes 128,180,222]
+"""
+import argparse
+import os
+import time
+
+from application_client.client import Client, max_chunk_size
+from application_client.simulator import SimulatedDevice
+
+MB = 1 << 20
+# The chunk size the client used to hard-code
+LEGACY_CHUNK_SIZE = 180
+PATH = "m/44'/535348'/0'"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=float, default=1)
+    parser.add_argument("--chunk-sizes", default=f"64,128,180,200,{max_chunk_size()}")
+    args = parser.parse_args()
+
+    transaction = os.urandom(int(args.size_mb * MB))
+    per_mb = MB / len(transaction)
+
+    def run(chunk_size):
+        backend = SimulatedDevice()
+        client = Client(backend, use_block_protocol=True, chunk_size=chunk_size)
+        start = time.perf_counter()
+        client.sign_tx(PATH, transaction)
+        return backend.exchanges * per_mb, (time.perf_counter() - start) * per_mb
+
+    legacy, _ = run(LEGACY_CHUNK_SIZE)
+    for chunk_size in map(int, args.chunk_sizes.split(",")):
+        exchanges, elapsed = run(chunk_size)
+        print(f"chunk {chunk_size:4}  exchanges {exchanges:8.0f} /MB  "
+              f"({exchanges / legacy:6.1%} of chunk {LEGACY_CHUNK_SIZE})  "
+              f"host time {elapsed * 1000:7.1f} ms/MB")
+
+
+if __name__ == "__main__":
+    main()
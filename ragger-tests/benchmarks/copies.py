@@ -0,0 +1,131 @@
+"""
+Micro-benchmark of the host side data path of the block protocol.
+
+Compares the client as it was before the memoryview/bytearray rework with the
+current one, on signing a large transaction and on receiving a large result
+through RESULT_ACCUMULATING. For each it reports the time per signed
+megabyte, and in a separate traced pass the peak memory while linking the
+parameters and while exchanging them.
+
+Run from the ragger-tests directory:
+
+    python -m benchmarks.copies [--size-mb 4] [--result-kb 256]
+"""
+import argparse
+import os
+import time
+import tracemalloc
+from hashlib import sha256
+
+from application_client.client import (CLA, P1, P2, Client, HostToLedger, InsType, LedgerToHost,
+                                       pack_derivation_path)
+from benchmarks.loopback import LoopbackBackend
+
+MB = 1 << 20
+PATH = "m/44'/535348'/0'"
+
+
+# The client data path before the rework, kept as a reference point. sign_tx
+# is overridden too, as the current one streams the result through
+# stream_with_blocks rather than calling send_with_blocks.
+class LegacyClient(Client):
+    def sign_tx(self, path, transaction):
+        tx_len = (len(transaction)).to_bytes(4, byteorder='little')
+        payload = [tx_len + transaction, pack_derivation_path(path)]
+        return self.send_with_blocks(CLA, InsType.SIGN_TX, P1, P2, payload)
+
+    def send_with_blocks(self, cla, ins, p1, p2, payload, extra_data={}):
+        chunk_size = 180
+        parameter_list = []
+        data = {}
+        for item in payload:
+            chunk_list = []
+            for i in range(0, len(item), chunk_size):
+                chunk_list.append(item[i:i + chunk_size])
+            last_hash = b'\x00' * 32
+            for chunk in reversed(chunk_list):
+                linked_chunk = last_hash + chunk
+                last_hash = sha256(linked_chunk).digest()
+                data[last_hash.hex()] = linked_chunk
+            parameter_list.append(last_hash)
+        initialPayload = (HostToLedger.START.to_bytes(1, byteorder='little')
+                          + b''.join(parameter_list))
+        return self.handle_block_protocol(cla, ins, p1, p2, initialPayload, data)
+
+    def handle_block_protocol(self, cla, ins, p1, p2, initialPayload, data, streams=[]):
+        payload = initialPayload
+        rv_instruction = -1
+        result = b''
+        while rv_instruction != LedgerToHost.RESULT_FINAL:
+            rv = self.backend.exchange(cla=cla, ins=ins, p1=p1, p2=p2, data=payload).data
+            rv_instruction = rv[0]
+            rv_payload = rv[1:]
+            if rv_instruction == LedgerToHost.RESULT_ACCUMULATING:
+                result = result + rv_payload
+                payload = HostToLedger.RESULT_ACCUMULATING_RESPONSE.to_bytes(1, byteorder='little')
+            elif rv_instruction == LedgerToHost.RESULT_FINAL:
+                result = result + rv_payload
+            elif rv_instruction == LedgerToHost.GET_CHUNK:
+                chunk = data[rv_payload.hex()]
+                payload = (HostToLedger.GET_CHUNK_RESPONSE_SUCCESS.to_bytes(1, byteorder='little')
+                           + chunk)
+        return result
+
+
+# Times a signature in a pass of its own, as tracing slows allocations down,
+# then traces the peak memory while linking the parameters, up to the first
+# exchange, and while exchanging them.
+def run(client_class, transaction: bytes, result_copies: int) -> dict:
+    backend = LoopbackBackend(result_copies=result_copies)
+    client = client_class(backend, use_block_protocol=True)
+    start = time.perf_counter()
+    client.sign_tx(PATH, transaction)
+    elapsed = time.perf_counter() - start
+    exchanges = backend.exchanges
+
+    backend = LoopbackBackend(result_copies=result_copies)
+    client = client_class(backend, use_block_protocol=True)
+    link_peak = []
+    exchange = backend.exchange
+    def first_exchange(*args, **kwargs):
+        if not link_peak:
+            link_peak.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        return exchange(*args, **kwargs)
+    backend.exchange = first_exchange
+    tracemalloc.start()
+    try:
+        client.sign_tx(PATH, transaction)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    per_mb = MB / max(len(transaction), 1)
+    return {
+        "seconds_per_mb": elapsed * per_mb,
+        "link_peak_mb": link_peak[0] / MB,
+        "exchange_peak_mb": peak / MB,
+        "exchanges": exchanges,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=float, default=4)
+    parser.add_argument("--result-kb", type=int, default=256)
+    args = parser.parse_args()
+
+    transaction = os.urandom(int(args.size_mb * MB))
+    # Each parameter digest is 32 bytes, and SIGN_TX has two parameters
+    result_copies = max(1, args.result_kb * 1024 // 64)
+
+    for workload, copies in (("sign", 1), ("sign+result", result_copies)):
+        for name, client_class in (("before", LegacyClient), ("after", Client)):
+            r = run(client_class, transaction, copies)
+            print(f"{workload:12} {name:7} "
+                  f"time {r['seconds_per_mb'] * 1000:8.1f} ms/MB  "
+                  f"peak link {r['link_peak_mb']:7.1f} MB  "
+                  f"exchange {r['exchange_peak_mb']:7.1f} MB  exchanges {r['exchanges']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+from hashlib import sha256
+
+from ragger.utils import RAPDU
+
+from application_client.client import HostToLedger, LedgerToHost, MAX_APDU_LEN
+
+
+# A minimal stand-in for the device side of the block protocol, used to drive
+# the client without a device or Speculos. Every parameter is fetched front to
+# back and checked against its hash, then the device answers with the sha256
+# of each parameter, repeated result_copies times and streamed back through
+# RESULT_ACCUMULATING when it does not fit in one response.
+class LoopbackBackend:
+    def __init__(self, result_copies: int = 1) -> None:
+        self.result_copies = result_copies
+        self.exchanges = 0
+        self._device = None
+
+    def exchange(self, cla, ins, p1=0, p2=0, data=b"") -> RAPDU:
+        self.exchanges += 1
+        data = bytes(data)
+        if data[0] == HostToLedger.START:
+            self._device = self._run(data[1:])
+            response = next(self._device)
+        else:
+            response = self._device.send(data)
+        return RAPDU(0x9000, response)
+
+    def _run(self, hashes: bytes):
+        digests = []
+        for i in range(0, len(hashes), 32):
+            block_hash = hashes[i:i + 32]
+            param = sha256()
+            while block_hash != b'\x00' * 32:
+                reply = yield bytes([LedgerToHost.GET_CHUNK]) + block_hash
+                block = reply[1:]
+                if (reply[0] != HostToLedger.GET_CHUNK_RESPONSE_SUCCESS
+                        or sha256(block).digest() != block_hash):
+                    raise RuntimeError("Bad block received from the host")
+                block_hash = block[:32]
+                param.update(block[32:])
+            digests.append(param.digest())
+
+        result = b''.join(digests) * self.result_copies
+        fragment = MAX_APDU_LEN - 1
+        while len(result) > fragment:
+            yield bytes([LedgerToHost.RESULT_ACCUMULATING]) + result[:fragment]
+            result = result[fragment:]
+        yield bytes([LedgerToHost.RESULT_FINAL]) + result
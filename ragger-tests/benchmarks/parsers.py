@@ -0,0 +1,123 @@
+"""
+Throughput of the app's parsers over randomised payloads, as JSON for tracking.
+
+Encodes --count random values of the TestParsers schema and as many random
+transactions with the schema module, reporting the host encoding rate, then
+streams them through TEST_PARSERS and SIGN_TX, reporting the calls and bytes
+parsed per second and the exchanges per call.
+
+Run from the ragger-tests directory:
+
+    python -m benchmarks.parsers [--backend simulator|speculos] [--device nanosp]
+                                 [--count 100] [--tx-size 1K] [--seed 0]
+
+TEST_PARSERS is only built for the Nano devices. It shows a scroller for each
+parsed field, which is pressed through up to the closing "Parse done" screen,
+and SIGN_TX reviews are approved, with the approver of benchmarks.suite.
+"""
+import argparse
+import contextlib
+import json
+import random
+import time
+from typing import Callable, Dict, List, Optional
+
+from application_client.client import Client
+from application_client.schema import (Array, Byte, DArray, Encoder, Schema, SignPayload,
+                                       TestParsersSchema)
+from application_client.simulator import SimulatedDevice
+
+from .suite import enable_blind_signing, metadata, nano_approver, parse_size, speculos_backend
+
+PATH = "m/44'/535348'/0'"
+
+
+def random_value(schema: Schema, rng: random.Random):
+    if isinstance(schema, tuple):
+        return tuple(random_value(item, rng) for item in schema)
+    if isinstance(schema, Array):
+        if isinstance(schema.item, Byte):
+            return rng.randbytes(schema.length)
+        return [random_value(schema.item, rng) for _ in range(schema.length)]
+    if isinstance(schema, DArray):
+        length = rng.randint(0, schema.max_length)
+        if isinstance(schema.item, Byte):
+            return rng.randbytes(length)
+        return [random_value(schema.item, rng) for _ in range(length)]
+    return rng.getrandbits(8 * schema.size)
+
+
+def encode_rate(encoder: Encoder, values: List) -> Dict:
+    start = time.perf_counter()
+    encoded = encoder.encode_many(values)
+    seconds = time.perf_counter() - start
+    return {"records": len(values), "bytes": len(encoded),
+            "records_per_s": len(values) / seconds, "mb_per_s": len(encoded) / seconds / (1 << 20)}
+
+
+def parse_rate(backend, call: Callable[[bytes], bytes], payloads: List[bytes],
+               approve: Optional[Callable] = None) -> Dict:
+    exchanges_before = getattr(backend, "exchanges", None)
+    seconds = 0.0
+    for payload in payloads:
+        if approve is not None:
+            approve()
+        start = time.perf_counter()
+        call(payload)
+        seconds += time.perf_counter() - start
+    size = sum(map(len, payloads))
+    result = {"calls": len(payloads), "bytes": size, "calls_per_s": len(payloads) / seconds,
+              "kb_per_s": size / seconds / 1024}
+    if exchanges_before is not None:
+        result["exchanges_per_call"] = (backend.exchanges - exchanges_before) / len(payloads)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", choices=["simulator", "speculos"], default="simulator")
+    parser.add_argument("--device", default="nanosp")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--tx-size", default="1K", help="size of the random transactions")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    test_parsers = Encoder(TestParsersSchema)
+    sign_payload = Encoder(SignPayload)
+    values = [random_value(TestParsersSchema, rng) for _ in range(args.count)]
+    transactions = [rng.randbytes(parse_size(args.tx_size)) for _ in range(args.count)]
+    results = {
+        "encode": {"test_parsers": encode_rate(test_parsers, values),
+                   "sign_tx": encode_rate(sign_payload, transactions)},
+    }
+
+    if args.backend == "simulator":
+        device, backend = None, contextlib.nullcontext(SimulatedDevice())
+    else:
+        device, backend = speculos_backend(args.device)
+        if not device.name.startswith("nano"):
+            parser.error("TEST_PARSERS is only built for the Nano devices")
+
+    with backend as backend:
+        client = Client(backend, use_block_protocol=True)
+        show_parsed = approve = None
+        if device is not None:
+            enable_blind_signing(backend)
+            show_parsed = nano_approver(backend, text="^Parse done$", last="right_click")
+            approve = nano_approver(backend)
+        results["test_parsers"] = parse_rate(backend, client.test_parsers,
+                                             [test_parsers.encode(value) for value in values],
+                                             show_parsed)
+        # sign_tx adds the length prefix of SignPayload itself
+        results["sign_tx"] = parse_rate(backend,
+                                        lambda transaction: client.sign_tx(PATH, transaction),
+                                        transactions, approve)
+
+    print(json.dumps({"metadata": {**metadata(), "backend": args.backend,
+                                   "device": device.name if device else None, "seed": args.seed},
+                      "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
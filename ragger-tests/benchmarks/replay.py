@@ -0,0 +1,64 @@
+"""
+Times signing a transaction against a recorded APDU trace, so host side
+changes can be compared on a captured device session without the device.
+
+Run from the ragger-tests directory:
+
+    python -m benchmarks.replay --trace session.trace --transaction tx.bin [--path m/44'/535348'/0']
+
+The trace must come from signing the same transaction with the same client
+settings, e.g. by passing a RecordingBackend to Client. Without --trace, one
+is recorded from the simulator first.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from application_client.client import Client
+from application_client.simulator import SimulatedDevice
+from application_client.trace import RecordingBackend, ReplayBackend
+
+MB = 1 << 20
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--trace")
+    parser.add_argument("--transaction", help="file holding the transaction, random if not given")
+    parser.add_argument("--size-mb", type=float, default=1)
+    parser.add_argument("--path", default="m/44'/535348'/0'")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--realtime", action="store_true",
+                        help="wait for the recorded device latency")
+    args = parser.parse_args()
+
+    if args.transaction:
+        with open(args.transaction, "rb") as f:
+            transaction = f.read()
+    else:
+        transaction = os.urandom(int(args.size_mb * MB))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trace = args.trace
+        if trace is None:
+            trace = os.path.join(tmp, "session.trace")
+            with RecordingBackend(SimulatedDevice(), trace) as backend:
+                Client(backend, use_block_protocol=True).sign_tx(args.path, transaction)
+
+        replay = ReplayBackend(trace, realtime=args.realtime)
+        device_time = sum(record.duration for record in replay.records)
+        print(f"trace: {len(replay.records)} exchanges, "
+              f"{device_time * 1000:.1f} ms recorded device time")
+        for _ in range(args.repeat):
+            replay.rewind()
+            client = Client(replay, use_block_protocol=True)
+            start = time.perf_counter()
+            client.sign_tx(args.path, transaction)
+            elapsed = time.perf_counter() - start
+            print(f"replayed in {elapsed * 1000:8.1f} ms  "
+                  f"({len(transaction) / MB / elapsed:6.1f} MB/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Start-up cost of the client modules, as JSON for tracking.
+
+For each module, runs --runs fresh interpreters which import it and then make
+a first call (packing a path and linking a SIGN_TX payload into chunks, up to
+the START message), reporting the median and the minimum of the wall time of
+the interpreter, the import and the first call. application_client.core only
+imports the standard library; application_client.client adds the ragger
+Client on top of it.
+
+Run from the ragger-tests directory:
+
+    python -m benchmarks.startup [--runs 20] \
+        [--modules application_client.core,application_client.client]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from .suite import metadata
+
+RAGGER_TESTS = Path(__file__).parents[1]
+
+# Prints the import and first call times, in seconds, of the module given as
+# argument, and the third party packages it loaded
+PROBE = """
+import sys, time
+before = set(sys.modules)
+start = time.perf_counter()
+module = __import__(sys.argv[1], fromlist=["_"])
+imported = time.perf_counter()
+with module.ChunkStore(max_bytes=None).session() as chunks:
+    module.link_parameters([(1024).to_bytes(4, "little") + bytes(1024),
+                            module.pack_derivation_path("m/44'/535348'/0'")], chunks)
+called = time.perf_counter()
+loaded = sorted({name.split(".")[0] for name in set(sys.modules) - before}
+                - set(sys.stdlib_module_names) - {"application_client"})
+print(imported - start, called - imported, ",".join(loaded))
+"""
+
+
+def probe(module: str) -> dict:
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", PROBE, module], capture_output=True, text=True,
+                         check=True, cwd=RAGGER_TESTS).stdout.split()
+    return {"process": time.perf_counter() - start, "import": float(out[0]),
+            "first_call": float(out[1]), "third_party": out[2].split(",") if len(out) > 2 else []}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--modules", default="application_client.core,application_client.client")
+    args = parser.parse_args()
+
+    results = []
+    for module in args.modules.split(","):
+        runs = [probe(module) for _ in range(args.runs)]
+        result = {"module": module, "runs": args.runs, "third_party": runs[-1]["third_party"]}
+        for key in ["process", "import", "first_call"]:
+            values = [run[key] for run in runs]
+            result[f"{key}_ms"] = {"median": statistics.median(values) * 1000,
+                                   "min": min(values) * 1000}
+        results.append(result)
+        print(json.dumps(result), file=sys.stderr)
+
+    print(json.dumps({"metadata": metadata(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
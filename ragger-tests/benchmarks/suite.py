@@ -0,0 +1,236 @@
+"""
+Throughput and latency benchmarks of the host client, as JSON for tracking.
+
+Runs get_app_and_version, get_public_key and sign_tx over the block protocol,
+the latter over a range of transaction sizes, and reports for each case the
+ops/s, the p50 and p99 latency, the exchanges per call and the peak RSS.
+
+Run from the ragger-tests directory:
+
+    python -m benchmarks.suite [--backends simulator,speculos] [--device nanosp]
+                               [--sizes 1,1K,64K,1M,16M,64M] [--output results.json]
+
+Each case runs in a fresh worker process, so that its peak RSS is its own. The
+simulator backend runs in that process. The speculos backend starts the app
+built for --device, found the same way as by pytest, afresh for each case;
+signing needs the review to be approved, which is only automated on the Nano
+devices.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ragger.utils import RAPDU
+
+from application_client.client import Client
+from application_client.simulator import SimulatedDevice
+
+PATH = "m/44'/535348'/0'"
+UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+OPERATIONS = ["get_app_and_version", "get_public_key", "sign_tx"]
+
+
+def parse_size(size: str) -> int:
+    if size[-1:].upper() in UNITS:
+        return int(float(size[:-1]) * UNITS[size[-1:].upper()])
+    return int(size)
+
+
+# Nearest rank percentile of sorted values
+def percentile(values: List[float], fraction: float) -> float:
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+# Counts the exchanges of any backend
+class CountingBackend:
+    def __init__(self, backend) -> None:
+        self.backend = backend
+        self.exchanges = 0
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def exchange(self, *args, **kwargs) -> RAPDU:
+        self.exchanges += 1
+        return self.backend.exchange(*args, **kwargs)
+
+
+def run_case(backend, operation: str, size: int, min_time: float, min_iterations: int,
+             max_iterations: int, approve: Optional[Callable] = None) -> Dict:
+    backend = CountingBackend(backend)
+    client = Client(backend, use_block_protocol=True)
+    transaction = os.urandom(size)
+
+    if operation == "sign_tx":
+        def call():
+            client.sign_tx(PATH, transaction)
+    elif operation == "get_public_key":
+        def call():
+            client.get_public_key(PATH)
+    else:
+        def call():
+            client.get_app_and_version()
+
+    # The prompts are prepared for outside of the timed calls
+    prepare = approve or (lambda: None)
+    prepare()
+    call()
+    backend.exchanges = 0
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < max_iterations and (len(latencies) < min_iterations
+                                               or time.perf_counter() - start < min_time):
+        prepare()
+        call_start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - call_start)
+    exchanges = backend.exchanges / len(latencies)
+
+    # Tracing slows allocations down, so it is kept out of the timed calls
+    prepare()
+    tracemalloc.start()
+    call()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "operation": operation,
+        "size": size if operation == "sign_tx" else None,
+        "iterations": len(latencies),
+        "ops_per_second": len(latencies) / sum(latencies),
+        "bytes_per_second": (size * len(latencies) / sum(latencies)
+                             if operation == "sign_tx" else None),
+        "p50_seconds": percentile(latencies, 0.50),
+        "p99_seconds": percentile(latencies, 0.99),
+        "exchanges_per_call": exchanges,
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "peak_traced_bytes": traced_peak,
+    }
+
+
+def run_simulator_case(*args) -> Dict:
+    return run_case(SimulatedDevice(), *args)
+
+
+def speculos_backend(device_name: str):
+    from ledgered.devices import Devices
+    from ragger.backend import SpeculosBackend
+    from ragger.conftest.base_conftest import prepare_speculos_args
+
+    device = Devices.get_by_name(device_name)
+    app_path, speculos_args = prepare_speculos_args(Path(__file__).parents[1], device,
+                                                    False, False, "", [])
+    return device, SpeculosBackend(app_path, device=device, **speculos_args)
+
+
+def run_speculos_case(device_name: str, operation: str, *args) -> Dict:
+    device, backend = speculos_backend(device_name)
+    with backend:
+        approve = None
+        if operation == "sign_tx":
+            enable_blind_signing(backend)
+            approve = nano_approver(backend)
+        return {"device": device.name, **run_case(backend, operation, *args, approve=approve)}
+
+
+# Presses through the prompts of a call once they show, from a thread, while
+# the client waits for the result: moves right until the screen shows text,
+# then presses last, which approves a SIGN_TX review by default.
+def nano_approver(backend, text: str = "^Approve$", last: str = "both_click",
+                  timeout: float = 30) -> Callable:
+    def approve():
+        deadline = time.monotonic() + timeout
+        backend.wait_for_screen_change(timeout=timeout)
+        while not backend.compare_screen_with_text(text):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Timeout waiting for {text!r} on screen")
+            backend.right_click()
+            backend.wait_for_screen_change(timeout=10)
+        getattr(backend, last)()
+
+    def start():
+        # The prompts start from the home screen, which the backend's reference
+        # screen is brought up to, as the last prompts left it behind
+        backend.wait_for_home_screen(timeout=10)
+        threading.Thread(target=approve, daemon=True).start()
+    return start
+
+
+def enable_blind_signing(backend) -> None:
+    for press in ["right_click", "right_click", "both_click", "both_click", "right_click",
+                  "both_click", "left_click", "left_click"]:
+        getattr(backend, press)()
+        backend.wait_for_screen_change(timeout=10)
+
+
+def cases(sizes: List[int]) -> List[Tuple[str, int]]:
+    return [(operation, size) for operation in OPERATIONS
+            for size in (sizes if operation == "sign_tx" else [0])]
+
+
+def metadata() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backends", default="simulator")
+    parser.add_argument("--device", default="nanosp")
+    parser.add_argument("--sizes", default="1,1K,64K,1M,16M,64M")
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds to run each case for")
+    parser.add_argument("--min-iterations", type=int, default=3)
+    parser.add_argument("--max-iterations", type=int, default=1000)
+    parser.add_argument("--output", help="file to write the results to, instead of stdout")
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    limits = (args.min_time, args.min_iterations, args.max_iterations)
+    results = []
+
+    for backend_name in args.backends.split(","):
+        if backend_name not in ("simulator", "speculos"):
+            parser.error(f"Unknown backend {backend_name}")
+        for operation, size in cases(sizes):
+            if backend_name == "simulator":
+                run, case = run_simulator_case, (operation, size, *limits)
+            elif operation == "sign_tx" and not args.device.startswith("nano"):
+                continue
+            else:
+                run, case = run_speculos_case, (args.device, operation, size, *limits)
+            with ProcessPoolExecutor(max_workers=1) as worker:
+                result = worker.submit(run, *case).result()
+            results.append({"backend": backend_name, **result})
+            print(json.dumps(results[-1]), file=sys.stderr)
+
+    report = json.dumps({"metadata": metadata(), "results": results}, indent=2)
+    if args.output:
+        Path(args.output).write_text(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
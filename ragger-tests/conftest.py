@@ -1,6 +1,9 @@
 from ragger.conftest import configuration
 from ragger.navigator import NavInsID
+import os
 import pytest
+import snapshot_manifest
+from utils import AppSettings, shutdown_task_pool
 ###########################
 ### CONFIGURATION START ###
 ###########################
@@ -8,6 +11,10 @@ import pytest
 # You can configure optional parameters by overriding the value of ragger.configuration.OPTIONAL_CONFIGURATION
 # Please refer to ragger/conftest/configuration.py for their descriptions and accepted values
 
+# Start the app once per session, and keep it warm between tests: see
+# reset_warm_backend below
+configuration.OPTIONAL.BACKEND_SCOPE = "session"
+
 #########################
 ### CONFIGURATION END ###
 #########################
@@ -15,12 +22,15 @@ import pytest
 # Pull all features from the base ragger conftest using the overridden configuration
 pytest_plugins = ("ragger.conftest.base_conftest", )
 
+# Compare screens with the golden snapshots by hash first
+snapshot_manifest.install()
+
 # Notes :
 # 1. Remove this fixture once the pending review screen is removed from the app
 # 2. This fixture clears the pending review screen before each test
 # 3. The scope should be the same as the one configured by BACKEND_SCOPE in 
 # ragger/conftest/configuration.py
-# @pytest.fixture(scope="class", autouse=True)
+# @pytest.fixture(scope="session", autouse=True)
 # def clear_pending_review(firmware, navigator):
 #     # Press a button to clear the pending review
 #     if firmware.device.startswith("nano"):
@@ -29,3 +39,60 @@ pytest_plugins = ("ragger.conftest.base_conftest", )
 #             NavInsID.BOTH_CLICK,
 #         ]
 #         navigator.navigate(instructions,screen_change_before_first_instruction=False)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def session_task_pool():
+    yield
+    shutdown_task_pool()
+
+
+# In parallel runs, run-ragger-tests.sh gives each device a range of ports from
+# SPECULOS_PORT_BASE, and each pytest-xdist worker takes its own pair of them
+# rather than racing the other workers for unused ones
+@pytest.fixture(scope=configuration.OPTIONAL.BACKEND_SCOPE)
+def additional_speculos_arguments():
+    port_base = os.environ.get("SPECULOS_PORT_BASE")
+    if port_base is None:
+        return []
+    worker = int(os.environ.get("PYTEST_XDIST_WORKER", "gw0")[2:])
+    api_port = int(port_base) + 2 * worker
+    return ["--api-port", str(api_port), "--apdu-port", str(api_port + 1)]
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    setattr(item, f"report_{report.when}", report)
+
+
+@pytest.fixture(scope=configuration.OPTIONAL.BACKEND_SCOPE)
+def app_settings(device, navigator):
+    return AppSettings(device, navigator)
+
+
+# The app is only restarted when a test leaves it in a state the next one
+# cannot start from: when it failed, possibly midway through a review or a
+# settings change, when the app is not back to its home screen, or when its
+# settings are not the defaults any more. Every test, including those which do
+# not ask for app_settings, then starts from the defaults, whatever the order
+# the tests run in.
+@pytest.fixture(autouse=True)
+def reset_warm_backend(request, backend_name):
+    yield
+    backend = request.node.funcargs.get("backend")
+    if backend_name != "speculos" or backend is None:
+        return
+    reports = [getattr(request.node, f"report_{when}", None) for when in ("setup", "call")]
+    failed = any(report is not None and report.failed for report in reports)
+    settings = request.node.funcargs.get("app_settings")
+    if not failed and (settings is None or settings.at_defaults()):
+        try:
+            backend.wait_for_home_screen(timeout=5)
+            return
+        except TimeoutError:
+            pass
+    backend.__exit__(None, None, None)
+    backend.__enter__()
+    request.getfixturevalue("app_settings").reset()
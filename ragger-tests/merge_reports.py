@@ -0,0 +1,76 @@
+"""
+Merges the JUnit reports of a parallel run-ragger-tests.sh run into one.
+
+Each input report is named after its device, e.g. reports/nanosp.xml. Writes
+the merged report, with one test suite per device, and prints a summary of
+the results along with the snapshots which differ from the golden ones.
+
+    python ragger-tests/merge_reports.py --output reports/report.xml reports/*.xml
+"""
+import argparse
+import sys
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import List
+
+SNAPSHOTS = Path(__file__).parent / "snapshots"
+SNAPSHOTS_TMP = Path(__file__).parent / "snapshots-tmp"
+COUNTERS = ["tests", "failures", "errors", "skipped"]
+
+
+def merge(reports: List[Path]) -> ET.Element:
+    merged = ET.Element("testsuites")
+    for report in reports:
+        root = ET.parse(report).getroot()
+        for suite in root.iter("testsuite"):
+            suite.set("name", report.stem)
+            merged.append(suite)
+    for counter in COUNTERS + ["time"]:
+        total = sum(float(suite.get(counter, 0)) for suite in merged)
+        merged.set(counter, f"{total:.3f}" if counter == "time" else str(int(total)))
+    return merged
+
+
+# Snapshots taken during the run which are missing from or differ from the
+# golden ones, per device
+def snapshot_diffs(devices: List[str]) -> List[Path]:
+    diffs = []
+    for device in devices:
+        for snapshot in sorted((SNAPSHOTS_TMP / device).rglob("*.png")):
+            golden = SNAPSHOTS / snapshot.relative_to(SNAPSHOTS_TMP)
+            if not golden.exists() or golden.read_bytes() != snapshot.read_bytes():
+                diffs.append(snapshot)
+    return diffs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--output", required=True)
+    parser.add_argument("reports", nargs="+", type=Path)
+    args = parser.parse_args()
+
+    merged = merge(args.reports)
+    ET.ElementTree(merged).write(args.output, encoding="utf-8", xml_declaration=True)
+
+    failed = False
+    for suite in merged:
+        counts = {counter: int(suite.get(counter, 0)) for counter in COUNTERS}
+        failed |= counts["failures"] + counts["errors"] > 0
+        print(f"{suite.get('name'):8} {counts['tests']:4} tests  {counts['failures']:3} failed  "
+              f"{counts['errors']:3} errors  {counts['skipped']:3} skipped  "
+              f"{float(suite.get('time', 0)):7.1f} s")
+        for case in suite.iter("testcase"):
+            if case.find("failure") is not None or case.find("error") is not None:
+                print(f"    FAILED {case.get('classname')}::{case.get('name')}")
+
+    diffs = snapshot_diffs([report.stem for report in args.reports])
+    if diffs:
+        print("Snapshots differing from the golden ones:")
+        for diff in diffs:
+            print(f"    {diff.relative_to(SNAPSHOTS_TMP.parent)}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from hashlib import blake2b
+from typing import List, Optional, Sequence, Tuple
+
+from ecdsa import BadSignatureError
+from ecdsa.curves import Ed25519
+from ecdsa.errors import MalformedPointError
+from ecdsa.keys import VerifyingKey
+
+# (public key, signature, message)
+SignedMessage = Tuple[bytes, bytes, bytes]
+
+# Below this many signatures, a batch is checked in process
+MIN_PARALLEL_BATCH = 64
+
+
+def message_digest(message: bytes) -> bytes:
+    return blake2b(message, digest_size=32).digest()
+
+
+# Checks signatures of the app, made over the blake2b-256 hash of the message,
+# keeping the decoded public keys with their precomputed multiplication tables
+# in an LRU cache: decoding and precomputing a key costs a few signature
+# checks, after which checking one is several times faster.
+class SignatureVerifier:
+    def __init__(self, max_keys: int = 1024) -> None:
+        self.max_keys = max_keys
+        self._keys: "OrderedDict[bytes, VerifyingKey]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def verifying_key(self, public_key: bytes) -> VerifyingKey:
+        public_key = bytes(public_key)
+        with self._lock:
+            key = self._keys.get(public_key)
+            if key is not None:
+                self._keys.move_to_end(public_key)
+                return key
+        key = VerifyingKey.from_string(public_key, curve=Ed25519)
+        key.precompute()
+        with self._lock:
+            self._keys[public_key] = key
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+        return key
+
+    def verify(self, public_key: bytes, signature: bytes, message: bytes) -> bool:
+        try:
+            return self.verifying_key(public_key).verify(signature, message_digest(message))
+        except (BadSignatureError, MalformedPointError):
+            return False
+
+    def verify_many(self, items: Sequence[SignedMessage]) -> List[bool]:
+        return [self.verify(*item) for item in items]
+
+
+default_verifier = SignatureVerifier()
+
+
+@dataclass
+class BatchResult:
+    results: List[bool]
+    seconds: float
+
+    @property
+    def all_valid(self) -> bool:
+        return all(self.results)
+
+    @property
+    def per_second(self) -> float:
+        return len(self.results) / self.seconds if self.seconds else 0.0
+
+
+def _verify_chunk(items: Sequence[SignedMessage]) -> List[bool]:
+    return default_verifier.verify_many(items)
+
+
+# Checks a batch of signatures over a process pool, or in process for small
+# batches. Signatures by the same key are kept together, so that each worker
+# decodes and precomputes a key once. The results are in the order of items.
+def verify_batch(items: Sequence[SignedMessage], executor: Optional[Executor] = None,
+                 workers: Optional[int] = None) -> BatchResult:
+    start = time.perf_counter()
+    if len(items) < MIN_PARALLEL_BATCH and executor is None:
+        return BatchResult(_verify_chunk(items), time.perf_counter() - start)
+
+    order = sorted(range(len(items)), key=lambda i: bytes(items[i][0]))
+    workers = workers or getattr(executor, "_max_workers", None) or os.cpu_count() or 1
+    size = max(1, -(-len(order) // (4 * workers)))
+    chunks = [order[i:i + size] for i in range(0, len(order), size)]
+
+    owned = executor is None
+    if owned:
+        executor = ProcessPoolExecutor(workers)
+    try:
+        results: List[bool] = [False] * len(items)
+        futures = [executor.submit(_verify_chunk, [tuple(map(bytes, items[i])) for i in chunk])
+                   for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            for i, valid in zip(chunk, future.result()):
+                results[i] = valid
+    finally:
+        if owned:
+            executor.shutdown()
+    return BatchResult(results, time.perf_counter() - start)
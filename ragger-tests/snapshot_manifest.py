@@ -0,0 +1,196 @@
+"""
+Manifest of the golden snapshots, for comparing screens by hash.
+
+snapshots/manifest.json maps each golden snapshot, relative to snapshots/, to
+the sha256 of its file and of its decoded pixels. Once installed (by the
+conftest), a screen compared with a golden snapshot that is in the manifest
+is decoded and hashed, and only diffed pixel by pixel against the golden
+one when the hashes differ or the entry is stale.
+
+    python snapshot_manifest.py update   # rebuild the manifest
+    python snapshot_manifest.py verify   # check the whole tree against it
+
+verify reports snapshots missing from the manifest, stale entries, entries
+for deleted snapshots, duplicate snapshots within a test, and test
+directories that no test_*.py mentions any more.
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+SNAPSHOTS = Path(__file__).parent / "snapshots"
+MANIFEST = SNAPSHOTS / "manifest.json"
+
+Entry = Dict[str, str]
+
+
+def pixels_hash(image: Image.Image) -> str:
+    rgb = image.convert("RGB")
+    hasher = hashlib.sha256(b"%dx%d:" % rgb.size)
+    hasher.update(rgb.tobytes())
+    return hasher.hexdigest()
+
+
+def snapshot_entry(path: Path) -> Entry:
+    data = path.read_bytes()
+    with Image.open(path) as image:
+        return {"file": hashlib.sha256(data).hexdigest(), "pixels": pixels_hash(image)}
+
+
+def _keyed_entry(path: Path) -> Tuple[str, Entry]:
+    return path.relative_to(SNAPSHOTS).as_posix(), snapshot_entry(path)
+
+
+def build(workers: Optional[int] = None) -> Dict[str, Entry]:
+    paths = sorted(SNAPSHOTS.glob("*/*/*.png"))
+    with ProcessPoolExecutor(workers) as pool:
+        return dict(pool.map(_keyed_entry, paths, chunksize=16))
+
+
+def load() -> Dict[str, Entry]:
+    if not MANIFEST.exists():
+        return {}
+    return json.loads(MANIFEST.read_text())
+
+
+def save(manifest: Dict[str, Entry]) -> None:
+    MANIFEST.write_text(json.dumps(manifest, indent=1, sort_keys=True) + "\n")
+
+
+def verify(workers: Optional[int] = None) -> List[str]:
+    manifest = load()
+    current = build(workers)
+    problems = []
+    for key in sorted(current.keys() - manifest.keys()):
+        problems.append(f"missing from the manifest: {key}")
+    for key in sorted(manifest.keys() - current.keys()):
+        problems.append(f"snapshot deleted: {key}")
+    for key in sorted(current.keys() & manifest.keys()):
+        if current[key] != manifest[key]:
+            problems.append(f"stale manifest entry: {key}")
+
+    # Navigation only takes a snapshot when the screen changes, so the same
+    # screen twice in a row in one test is a leftover
+    for key, entry in current.items():
+        test_dir, name = key.rsplit("/", 1)
+        previous = f"{test_dir}/{int(name[:-4]) - 1:05}.png"
+        if previous in current and current[previous]["pixels"] == entry["pixels"]:
+            problems.append(f"duplicate of the previous snapshot: {key}")
+
+    sources = "".join(path.read_text() for path in Path(__file__).parent.glob("test_*.py"))
+    for test_dir in sorted({key.split("/")[1] for key in current}):
+        if test_dir.rstrip("_0123456789") not in sources:
+            problems.append(f"not used by any test: {test_dir}")
+    return problems
+
+
+class ManifestComparison:
+    def __init__(self, manifest: Dict[str, Entry], full_comparison) -> None:
+        self.manifest = {str((SNAPSHOTS / key).resolve()): entry for key, entry in manifest.items()}
+        self.full_comparison = full_comparison
+        self._file_hashes: Dict[str, str] = {}
+        self.hash_matches = 0
+        self.full_comparisons = 0
+
+    # Whether the golden snapshot file still is the one in the manifest,
+    # checked once per file
+    def _entry(self, golden: str) -> Optional[Entry]:
+        entry = self.manifest.get(golden)
+        if entry is None:
+            return None
+        if golden not in self._file_hashes:
+            try:
+                self._file_hashes[golden] = hashlib.sha256(Path(golden).read_bytes()).hexdigest()
+            except OSError:
+                return None
+        return entry if self._file_hashes[golden] == entry["file"] else None
+
+    # Whether snap has the pixels of the golden snapshot file, by the
+    # manifest. False when they differ, or the manifest can not tell.
+    def hash_match(self, golden, snap) -> bool:
+        if not isinstance(golden, (str, os.PathLike)):
+            return False
+        entry = self._entry(str(Path(golden).resolve()))
+        if entry is None:
+            return False
+        with Image.open(snap) as image:
+            match = pixels_hash(image) == entry["pixels"]
+        if hasattr(snap, "seek"):
+            snap.seek(0)
+        if match:
+            self.hash_matches += 1
+        return match
+
+    # A drop-in for ragger's screenshot_equal. ragger also uses it to compare
+    # two in-memory screenshots, which go straight to the full comparison.
+    def __call__(self, golden, snap, left: int = 0, upper: int = 0, right: int = 0,
+                 lower: int = 0) -> bool:
+        if not any([left, upper, right, lower]) and self.hash_match(golden, snap):
+            return True
+        self.full_comparisons += 1
+        return self.full_comparison(golden, snap, left=left, upper=upper, right=right, lower=lower)
+
+
+_installed: Optional[ManifestComparison] = None
+
+
+# Makes the Speculos backend compare screens with golden snapshots through
+# the manifest, if there is one. Only compare_screen_with_snapshot is
+# wrapped: the screenshot_equal helper it shares with the waits for screen
+# changes is left alone.
+def install() -> Optional[ManifestComparison]:
+    global _installed
+    if _installed is not None:
+        return _installed
+    manifest = load()
+    if not manifest:
+        return None
+    from ragger.backend.speculos import SpeculosBackend, screenshot_equal
+    comparison = ManifestComparison(manifest, screenshot_equal)
+    original = SpeculosBackend.compare_screen_with_snapshot
+
+    @functools.wraps(original)
+    def compare_screen_with_snapshot(self, golden_snap_path, crop=None, tmp_snap_path=None,
+                                     golden_run=False):
+        if crop is None and not golden_run:
+            snap = BytesIO(self._client.get_screenshot())
+            if comparison.hash_match(golden_snap_path, snap):
+                if tmp_snap_path:
+                    self._save_screen_snapshot(snap, tmp_snap_path)
+                return True
+        comparison.full_comparisons += 1
+        return original(self, golden_snap_path, crop, tmp_snap_path, golden_run)
+
+    SpeculosBackend.compare_screen_with_snapshot = compare_screen_with_snapshot
+    _installed = comparison
+    return comparison
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("command", choices=["update", "verify"])
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    if args.command == "update":
+        manifest = build(args.workers)
+        save(manifest)
+        print(f"{len(manifest)} snapshots in {MANIFEST}")
+    else:
+        problems = verify(args.workers)
+        for problem in problems:
+            print(problem)
+        sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+from hashlib import sha256
+
+import pytest
+
+from application_client import chunk_store
+from application_client.chunk_spill import MmapSpill, SqliteSpill
+from application_client.chunk_store import ChunkStore
+from application_client.client import Client
+from application_client.simulator import SimulatedDevice
+from utils import check_signature_validity
+
+PATH = "m/44'/535348'/0'"
+
+
+@pytest.mark.parametrize("spill_class", [MmapSpill, SqliteSpill])
+def test_chunk_store_spill(spill_class, tmp_path):
+    spill = spill_class(tmp_path / "spill")
+    spill.put(b"a" * 32, b"block")
+    spill.put(b"a" * 32, b"block")
+    assert b"a" * 32 in spill and b"b" * 32 not in spill
+    assert bytes(spill.get(b"a" * 32)) == b"block" and spill.get(b"b" * 32) is None
+    assert spill.nbytes == 5
+    spill.close()
+
+    with ChunkStore(max_bytes=4096, spill=spill_class()) as store:
+        device = SimulatedDevice()
+        client = Client(device, use_block_protocol=True, chunk_store=store)
+        transaction = b"looongtx" * 10000
+        _, public_key, _, _ = client.get_public_key(path=PATH)
+
+        signature = client.sign_tx(path=PATH, transaction=transaction)
+        assert check_signature_validity(public_key, signature, transaction)
+        assert store.nbytes <= 4096
+        assert store.counters.spills > 0 and store.counters.spill_hits > 0
+
+
+def test_chunk_store_memo(monkeypatch):
+    store = ChunkStore()
+    transaction = b"memoised tx" * 1000
+    with store.session() as session:
+        chain = session.link(transaction, 222)
+    # Only the blocks and the digests of the chain are held
+    assert store.nbytes == sum(len(store.get(digest)) for digest in chain[1]) + 32 * len(chain[1])
+
+    # The chain is found by content, whatever the type of the parameter, with
+    # the parameter hashed once rather than block by block
+    hashed = []
+    def counting_sha256(data):
+        hashed.append(len(data))
+        return sha256(data)
+    monkeypatch.setattr(chunk_store, "sha256", counting_sha256)
+    with store.session() as session:
+        assert session.link(bytearray(transaction), 222) == chain
+    assert hashed == [len(transaction)]
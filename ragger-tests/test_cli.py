@@ -0,0 +1,59 @@
+import io
+import itertools
+import json
+import tracemalloc
+
+from application_client import cli
+from application_client.client import Client
+from application_client.simulator import SimulatedDevice
+from utils import check_signature_validity
+
+PATH = "m/44'/535348'/0'"
+
+
+def test_cli_resume(tmp_path):
+    transactions = [b"cli tx %d" % i * i for i in range(6)]
+    records = b"".join(len(t).to_bytes(4, "little") + t for t in transactions)
+    device = SimulatedDevice()
+    client = Client(device, use_block_protocol=True)
+
+    output = tmp_path / "signatures.jsonl"
+    with open(output, "w") as f:
+        first_records = itertools.islice(cli.read_records(io.BytesIO(records), 0, 0, PATH), 4)
+        cli.sign_stream(client, first_records, f)
+    # Interrupted while writing the fifth signature
+    with open(output, "a") as f:
+        f.write('{"index": 4, "next_')
+
+    index, offset = cli.resume_point(str(output))
+    assert index == 4
+    with open(output, "a") as f:
+        remaining = cli.read_records(io.BytesIO(records[offset:]), offset, index, PATH)
+        cli.sign_stream(client, remaining, f)
+
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [line["index"] for line in lines] == list(range(6))
+    for line, transaction in zip(lines, transactions):
+        signature = bytes.fromhex(line["signature"])
+        assert check_signature_validity(device.public_key(PATH), signature, transaction)
+
+
+def test_cli_bounded_memory(tmp_path):
+    records = tmp_path / "records.bin"
+    with open(records, "wb") as f:
+        for i in range(100):
+            f.write((20_000).to_bytes(4, "little") + bytes([i]) * 20_000)
+    client = Client(SimulatedDevice(), use_block_protocol=True)
+
+    source, f = cli.open_input(str(records), "records", 0)
+    tracemalloc.start()
+    try:
+        with f, open(tmp_path / "signatures.jsonl", "w") as output:
+            signed = cli.sign_stream(client, cli.read_records(source, 0, 0, PATH), output)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        source.close()
+    assert signed == 100
+    # 2 MB were signed, holding the transaction being signed and the next one
+    assert peak < 500_000
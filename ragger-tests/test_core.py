@@ -0,0 +1,52 @@
+import subprocess
+import sys
+from hashlib import sha256
+from pathlib import Path
+
+import pytest
+
+from application_client import core
+from application_client.simulator import SimulatedDevice
+from utils import check_signature_validity
+
+PATH = "m/44'/535348'/0'"
+
+
+def test_core_client():
+    # The core needs no third party package, and talks to the app on its own;
+    # the client only loads ragger once it needs it
+    for module in ["application_client.core", "application_client.client"]:
+        code = f"import sys, {module}; print(','.join(sorted(sys.modules)))"
+        loaded = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                check=True, cwd=Path(__file__).parent).stdout.strip().split(",")
+        assert not {"ragger", "bip_utils", "ecdsa"} & {name.split(".")[0] for name in loaded}
+
+    backend = SimulatedDevice()
+    transaction = b"core tx" * 100
+    payload = [len(transaction).to_bytes(4, "little") + transaction,
+               core.pack_derivation_path(PATH)]
+    signature = core.send_with_blocks(backend.exchange, core.CLA, core.InsType.SIGN_TX, core.P1,
+                                      core.P2, payload)
+    assert check_signature_validity(backend.public_key(PATH), signature, transaction)
+
+
+def test_core_mapping_of_blocks():
+    # Callers of older versions kept the blocks in a dict, by the hex of their
+    # hash, which the device may also put blocks in
+    backend = SimulatedDevice()
+    transaction = b"core tx"
+    blocks = {}
+    start = core.HostToLedger.START.to_bytes(1, "little")
+    for item in [len(transaction).to_bytes(4, "little") + transaction,
+                 core.pack_derivation_path(PATH)]:
+        block = bytes(core.HASH_LEN) + item
+        blocks[sha256(block).hexdigest()] = block
+        start += sha256(block).digest()
+
+    signature = core.handle_block_protocol(backend.exchange, core.CLA, core.InsType.SIGN_TX,
+                                           core.P1, core.P2, start, blocks)
+    assert check_signature_validity(backend.public_key(PATH), signature, transaction)
+
+    with pytest.raises(TypeError):
+        core.handle_block_protocol(backend.exchange, core.CLA, core.InsType.SIGN_TX, core.P1,
+                                   core.P2, start, list(blocks.values()))
@@ -0,0 +1,87 @@
+import io
+
+import pytest
+
+from application_client.client import Client
+from application_client.device_pool import DevicePool
+from application_client.simulator import SimulatedDevice
+from utils import check_signature_validity
+
+PATH = "m/44'/535348'/0'"
+
+
+def test_device_pool():
+    devices = [SimulatedDevice() for _ in range(3)]
+    jobs = [(PATH, b"tx %d" % i * (i + 1)) for i in range(12)]
+
+    with DevicePool([Client(device, use_block_protocol=True) for device in devices]) as pool:
+        signatures = pool.sign_all(jobs)
+
+    public_key = devices[0].public_key(PATH)
+    for (_, transaction), signature in zip(jobs, signatures):
+        assert check_signature_validity(public_key, signature, transaction)
+    assert sum(stats.jobs for stats in pool.stats) == len(jobs)
+
+
+def test_device_pool_shared_queue():
+    # Streams have no size to balance the devices by: they take them as they
+    # become idle, and the jobs are taken from the iterable as they go
+    devices = [SimulatedDevice(latency=0.002) for _ in range(3)]
+    pool = DevicePool([Client(device, use_block_protocol=True) for device in devices])
+    ahead = []
+    def jobs():
+        for i in range(9):
+            ahead.append(i - sum(stats.jobs for stats in pool.stats))
+            yield PATH, io.BytesIO(b"stream %d" % i * 100)
+
+    with pool:
+        signatures = pool.sign_all(jobs())
+
+    assert len(signatures) == 9
+    assert all(stats.jobs > 0 for stats in pool.stats)
+    assert max(ahead) <= 2 * len(devices)
+
+
+# A device gone from the transport, failing every exchange
+class UnpluggedDevice(SimulatedDevice):
+    def exchange(self, *args, **kwargs):
+        self.exchanges += 1
+        raise ConnectionError("Device unplugged")
+
+
+def test_device_pool_retries_on_another_device():
+    # Slow enough for the jobs to still be waiting when the other device fails
+    devices = [UnpluggedDevice(), SimulatedDevice(latency=0.005)]
+    jobs = [(PATH, b"tx %d" % i) for i in range(8)]
+    clients = [Client(device, use_block_protocol=True) for device in devices]
+
+    with DevicePool(clients, backoff=0.01, max_failures=2) as pool:
+        futures = [pool.submit(path, transaction) for path, transaction in jobs]
+    signatures = [future.result() for future in futures]
+
+    public_key = devices[1].public_key(PATH)
+    for (_, transaction), signature in zip(jobs, signatures):
+        assert check_signature_validity(public_key, signature, transaction)
+    unplugged, healthy = pool.stats
+    assert healthy.jobs == len(jobs) and healthy.errors == 0
+    # Out of rotation once it has failed max_failures times
+    assert unplugged.jobs == 0 and unplugged.retired
+    assert unplugged.errors == devices[0].exchanges == 2
+
+
+def test_device_pool_device_failing_every_time():
+    device = UnpluggedDevice()
+    pool = DevicePool([Client(device, use_block_protocol=True)], retries=5, backoff=0.01,
+                      max_failures=3)
+    with pool:
+        first = pool.submit(PATH, b"tx 1")
+        second = pool.submit(PATH, b"tx 2")
+        with pytest.raises(ConnectionError):
+            first.result(timeout=5)
+        with pytest.raises(ConnectionError):
+            second.result(timeout=5)
+        with pytest.raises(RuntimeError):
+            pool.submit(PATH, b"tx 3")
+
+    assert pool.stats[0].retired
+    assert pool.stats[0].errors == device.exchanges == 3
@@ -0,0 +1,51 @@
+from application_client.client import Client
+from application_client.key_cache import PublicKeyCache
+from application_client.simulator import SimulatedDevice
+
+
+def test_key_cache_warm_restart(tmp_path):
+    paths = [f"m/44'/535348'/{i}'" for i in range(3)]
+    cache_path = tmp_path / "keys.json"
+    with PublicKeyCache(path=cache_path) as cache:
+        keys = Client(SimulatedDevice(), use_block_protocol=True, key_cache=cache,
+                      device_id="simulator").get_public_keys(paths)
+
+    device = SimulatedDevice()
+    client = Client(device, use_block_protocol=True, key_cache=PublicKeyCache(path=cache_path),
+                    device_id="simulator")
+    assert client.get_public_keys(paths) == keys
+    assert device.exchanges == 0
+
+    # A version given by the caller takes precedence over the one last seen,
+    # and keys of another version are asked to the device
+    client = Client(device, use_block_protocol=True, key_cache=PublicKeyCache(path=cache_path),
+                    device_id="simulator", app_version="alamgu example 9.9.9")
+    assert client.get_public_keys(paths) == keys
+    assert device.exchanges > 0
+
+
+def test_key_cache_app_upgrade():
+    paths = [f"m/44'/535348'/{i}'" for i in range(3)]
+    cache = PublicKeyCache()
+    keys = Client(SimulatedDevice(), use_block_protocol=True, key_cache=cache,
+                  device_id="simulator").get_public_keys(paths)
+    version = cache.app_version("simulator")
+
+    # As if the keys had been cached by an older version of the app
+    cache.set_app_version("simulator", "alamgu example 0.0.0")
+    for path, (_, pub_key, _, chain_code) in zip(paths, keys):
+        cache.put(("simulator", "alamgu example 0.0.0", path), pub_key, chain_code)
+    cache.put(("other", "alamgu example 0.0.0", paths[0]), keys[0][1], keys[0][3])
+
+    device = SimulatedDevice()
+    client = Client(device, use_block_protocol=True, key_cache=cache, device_id="simulator")
+    assert client.refresh_app_version() == version
+    assert cache.app_version("simulator") == version
+    assert cache.get(("simulator", "alamgu example 0.0.0", paths[0])) is None
+    assert cache.get(("other", "alamgu example 0.0.0", paths[0])) is not None
+    assert client.get_public_keys(paths) == keys
+    assert device.exchanges > 0
+
+    cache.forget_device("simulator")
+    assert cache.app_version("simulator") is None
+    assert len(cache) == 1
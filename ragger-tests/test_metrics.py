@@ -0,0 +1,24 @@
+import pytest
+
+from application_client.client import Client
+from application_client.metrics import BlockProtocolMetrics
+from application_client.simulator import SimulatedDevice
+from ragger.error import ExceptionRAPDU
+
+PATH = "m/44'/535348'/0'"
+
+
+def test_metrics():
+    metrics = BlockProtocolMetrics()
+    device = SimulatedDevice()
+    client = Client(device, use_block_protocol=True, metrics=metrics)
+    client.sign_tx(path=PATH, transaction=b"measured tx" * 100)
+    with pytest.raises(ExceptionRAPDU):
+        client.sign_tx(path="m/44'/1'/0'", transaction=b"measured tx")
+
+    snapshot = metrics.snapshot()
+    assert snapshot["calls"] == 2 and snapshot["errors"] == 1
+    assert snapshot["exchanges"]["RESULT_FINAL"]["count"] == 1
+    assert sum(e["count"] for e in snapshot["exchanges"].values()) + 1 == device.exchanges
+    prometheus = metrics.to_prometheus()
+    assert 'alamgu_block_protocol_exchange_seconds_count{instruction="GET_CHUNK"}' in prometheus
@@ -1,6 +1,9 @@
+import asyncio
 import pytest
 
 from application_client.client import Client, Errors
+from application_client.async_client import AsyncClient
+from application_client.key_cache import PublicKeyCache
 from contextlib import contextmanager
 from ragger.bip import calculate_public_key_and_chaincode, CurveChoice
 from ragger.error import ExceptionRAPDU
@@ -17,6 +20,42 @@ def test_get_public_key_no_confirm(backend):
         assert public_key.hex() == "19e2fea57e82293b4fee8120d934f0c5a4907198f8df29e9a153cfd7d9383488"
 
 
+# Same as above, through the asyncio client
+def test_get_public_key_no_confirm_async(backend):
+    client = AsyncClient(backend, use_block_protocol=True)
+    _, public_key, _, _ = asyncio.run(client.get_public_key(path="m/44'/535348'/0'"))
+
+    assert public_key.hex() == "19e2fea57e82293b4fee8120d934f0c5a4907198f8df29e9a153cfd7d9383488"
+
+
+# Keys fetched in bulk are served from the cache, including after a reload from disk
+def test_get_public_keys_cached(backend, tmp_path):
+    paths = [f"m/44'/535348'/{i}'" for i in range(3)]
+    cache_path = tmp_path / "keys.json"
+
+    with PublicKeyCache(path=cache_path) as cache:
+        client = Client(backend, use_block_protocol=True, key_cache=cache, device_id="speculos")
+        keys = client.get_public_keys(paths)
+    assert keys[0][1].hex() == "19e2fea57e82293b4fee8120d934f0c5a4907198f8df29e9a153cfd7d9383488"
+
+    exchanges = []
+    exchange = backend.exchange
+    def counting_exchange(*args, **kwargs):
+        exchanges.append(kwargs.get("ins"))
+        return exchange(*args, **kwargs)
+    backend.exchange = counting_exchange
+
+    try:
+        client = Client(backend, use_block_protocol=True,
+                        key_cache=PublicKeyCache(path=cache_path), device_id="speculos")
+        assert client.get_public_keys(paths) == keys
+    finally:
+        backend.exchange = exchange
+
+    # The app version last seen is kept in the cache too
+    assert exchanges == []
+
+
 # In this test we check that the GET_PUBLIC_KEY works in confirmation mode
 def test_get_public_key_confirm_accepted(backend, scenario_navigator, firmware, navigator):
     client = Client(backend, use_block_protocol=True)
@@ -0,0 +1,36 @@
+import pytest
+
+from application_client.client import Client, pack_derivation_path
+from application_client.schema import Encoder, TestParsersSchema
+from application_client.simulator import SimulatedDevice, Status
+from ragger.error import ExceptionRAPDU
+
+
+def test_schema_encoder():
+    encoder = Encoder(TestParsersSchema)
+    value = (((7, bytes(range(32))), (0x0102, 0x0304)),
+             ((1, 2), (b"\xaa\xbb", [(5, 6)])))
+    params = encoder.encode(value)
+    assert params == (b"\x07" + bytes(range(32)) + b"\x01\x02\x04\x03"
+                      + (1).to_bytes(8, "big") + (2).to_bytes(8, "little")
+                      + b"\x02\xaa\xbb"
+                      + b"\x01" + (5).to_bytes(4, "big") + (6).to_bytes(4, "little"))
+    assert encoder.encode_many([value, value]) == params * 2
+
+    client = Client(SimulatedDevice(), use_block_protocol=True)
+    assert client.test_parsers(params) == b""
+    with pytest.raises(ValueError):
+        encoder.encode((value[0], (value[1][0], (bytes(25), []))))
+    # A DArray longer than its maximum is rejected by the device too
+    with pytest.raises(ExceptionRAPDU) as e:
+        client.test_parsers(params[:-12] + b"\x19" + bytes(25) + b"\x00")
+    assert e.value.status == Status.INVALID_PARAMETER
+
+
+def test_long_derivation_path_left_to_device():
+    # Paths of more than 10 levels are packed, and rejected by the app
+    path = "m/44'/535348'" + "/0" * 9
+    assert pack_derivation_path(path)[0] == 11
+    with pytest.raises(ExceptionRAPDU) as e:
+        Client(SimulatedDevice(), use_block_protocol=True).get_public_key(path=path)
+    assert e.value.status == Status.INVALID_PARAMETER
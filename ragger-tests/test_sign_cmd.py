@@ -3,12 +3,11 @@ import concurrent.futures
 import time
 
 from application_client.client import Client, Errors
-from contextlib import contextmanager
 from ragger.error import ExceptionRAPDU
-from ragger.navigator import NavIns, NavInsID
+from ragger.navigator import NavInsID
 from utils import ROOT_SCREENSHOT_PATH, check_signature_validity, run_apdu_and_nav_tasks_concurrently
 
-def test_sign_tx_short_tx(backend, scenario_navigator, firmware, navigator):
+def test_sign_tx_short_tx(backend, scenario_navigator, firmware, navigator, app_settings):
     client = Client(backend, use_block_protocol=True)
     path = "m/44'/535348'/0'"
 
@@ -37,7 +36,7 @@ def test_sign_tx_short_tx(backend, scenario_navigator, firmware, navigator):
                 , timeout=20
                 , path=scenario_navigator.screenshot_path
                 , test_case_name="test_sign_tx_short_tx_1"
-                , screen_change_before_first_instruction=True
+                , screen_change_before_first_instruction=False
                 , screen_change_after_last_instruction=True
             )
             # Below is similar to scenario_navigator.review_approve()
@@ -57,10 +56,13 @@ def test_sign_tx_short_tx(backend, scenario_navigator, firmware, navigator):
         assert len(result) == 64
         assert check_signature_validity(public_key, result, transaction)
 
-    with blind_sign_enabled(firmware, navigator):
-        run_apdu_and_nav_tasks_concurrently(apdu_task, nav_task, check_result)
+    app_settings.blind_sign = True
+    run_apdu_and_nav_tasks_concurrently(apdu_task, nav_task, check_result, backend=backend)
 
-def test_sign_tx_long_tx(backend, scenario_navigator, firmware, navigator):
+# The "file" variant streams the transaction from disk, and must show the same screens
+@pytest.mark.parametrize("source", ["bytes", "file"])
+def test_sign_tx_long_tx(backend, scenario_navigator, firmware, navigator, app_settings, source,
+                         tmp_path):
     client = Client(backend, use_block_protocol=True)
     path = "m/44'/535348'/0'"
 
@@ -68,8 +70,13 @@ def test_sign_tx_long_tx(backend, scenario_navigator, firmware, navigator):
 
     transaction=("looongtx" * 100).encode('utf-8')
 
+    tx_source = transaction
+    if source == "file":
+        tx_source = tmp_path / "transaction.bin"
+        tx_source.write_bytes(transaction)
+
     def apdu_task():
-        return client.sign_tx(path=path, transaction=transaction)
+        return client.sign_tx(path=path, transaction=tx_source)
 
     def nav_task():
         if firmware.device.startswith("nano"):
@@ -88,7 +95,7 @@ def test_sign_tx_long_tx(backend, scenario_navigator, firmware, navigator):
                 , timeout=20
                 , path=scenario_navigator.screenshot_path
                 , test_case_name="test_sign_tx_long_tx_1"
-                , screen_change_before_first_instruction=True
+                , screen_change_before_first_instruction=False
                 , screen_change_after_last_instruction=True
             )
             # Below is similar to scenario_navigator.review_approve()
@@ -108,12 +115,12 @@ def test_sign_tx_long_tx(backend, scenario_navigator, firmware, navigator):
         assert len(result) == 64
         assert check_signature_validity(public_key, result, transaction)
 
-    with blind_sign_enabled(firmware, navigator):
-        run_apdu_and_nav_tasks_concurrently(apdu_task, nav_task, check_result)
+    app_settings.blind_sign = True
+    run_apdu_and_nav_tasks_concurrently(apdu_task, nav_task, check_result, backend=backend)
 
 # Transaction signature refused test
 # The test will ask for a transaction signature that will be refused on screen
-def test_sign_tx_refused(backend, scenario_navigator, firmware, navigator):
+def test_sign_tx_refused(backend, scenario_navigator, firmware, navigator, app_settings):
     client = Client(backend, use_block_protocol=True)
     path = "m/44'/535348'/0'"
 
@@ -143,15 +150,15 @@ def test_sign_tx_refused(backend, scenario_navigator, firmware, navigator):
         assert len(result) == 64
         assert check_signature_validity(public_key, result, transaction)
 
+    app_settings.blind_sign = True
     with pytest.raises(ExceptionRAPDU) as e:
-        with blind_sign_enabled(firmware, navigator):
-            run_apdu_and_nav_tasks_concurrently(apdu_task, nav_task, check_result)
+        run_apdu_and_nav_tasks_concurrently(apdu_task, nav_task, check_result, backend=backend)
 
     # Assert that we have received a refusal
     # assert e.value.status == Errors.SW_DENY
     assert len(e.value.data) == 0
 
-def test_sign_tx_blindsign_disabled(backend, scenario_navigator, firmware, navigator):
+def test_sign_tx_blindsign_disabled(backend, scenario_navigator, firmware, navigator, app_settings):
     client = Client(backend, use_block_protocol=True)
     path = "m/44'/535348'/0'"
 
@@ -179,35 +186,10 @@ def test_sign_tx_blindsign_disabled(backend, scenario_navigator, firmware, navig
     def check_result(result):
         assert len(result) == 64
 
+    app_settings.blind_sign = False
     with pytest.raises(ExceptionRAPDU) as e:
-        run_apdu_and_nav_tasks_concurrently(apdu_task, nav_task, check_result)
+        run_apdu_and_nav_tasks_concurrently(apdu_task, nav_task, check_result, backend=backend)
 
     # Assert that we have received a refusal
     # assert e.value.status == Errors.SW_DENY
     assert len(e.value.data) == 0
-
-@contextmanager
-def blind_sign_enabled(firmware, navigator):
-    toggle_blind_sign(firmware, navigator)
-    try:
-        yield
-    except:
-        # Don't re-enable if we hit an exception
-        raise
-    else:
-        toggle_blind_sign(firmware, navigator)
-
-def toggle_blind_sign(firmware, navigator):
-    if firmware.device.startswith("nano"):
-        navigator.navigate(
-            instructions=[NavInsID.RIGHT_CLICK, NavInsID.RIGHT_CLICK, NavInsID.BOTH_CLICK, NavInsID.BOTH_CLICK, NavInsID.RIGHT_CLICK, NavInsID.BOTH_CLICK, NavInsID.LEFT_CLICK, NavInsID.LEFT_CLICK]
-            , timeout=10
-            , screen_change_before_first_instruction=False
-        )
-    else:
-        navigator.navigate([NavInsID.USE_CASE_HOME_SETTINGS,
-                            NavIns(NavInsID.TOUCH, (200, 113)),
-                            NavInsID.USE_CASE_SUB_SETTINGS_EXIT],
-                            timeout=10,
-                            screen_change_before_first_instruction=False,
-                            screen_change_after_last_instruction=False)
@@ -0,0 +1,20 @@
+from application_client.client import Client
+from application_client.simulator import SimulatedDevice
+from signature_verifier import verify_batch
+
+
+def test_verify_batch():
+    device = SimulatedDevice()
+    client = Client(device, use_block_protocol=True)
+    paths = ["m/44'/535348'/0'", "m/44'/535348'/1'"]
+    items = []
+    for i in range(80):
+        path = paths[i % 2]
+        transaction = b"batch tx %d" % i
+        items.append((device.public_key(path), client.sign_tx(path, transaction), transaction))
+    # A signature by the other key
+    items[3] = (items[0][0], items[3][1], items[3][2])
+
+    batch = verify_batch(items, workers=2)
+    assert batch.results == [i != 3 for i in range(80)]
+    assert batch.per_second > 0
@@ -0,0 +1,155 @@
+import asyncio
+import io
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from application_client import async_client
+from application_client.async_client import AsyncClient
+from application_client.chunk_store import ChunkStore
+from application_client.client import (CLA, Client, HostToLedger, InlineEntry, InsType,
+                                       pack_derivation_path)
+from application_client.simulator import SimulatedDevice, Status
+from ragger.error import ExceptionRAPDU
+from utils import check_signature_validity
+
+# These tests run the client against the in-process simulator, and need
+# neither a built app nor Speculos.
+
+PATH = "m/44'/535348'/0'"
+
+
+def test_simulator_version():
+    client = Client(SimulatedDevice(), use_block_protocol=True)
+    _, name = client.get_app_and_version()
+    assert name == "alamgu example"
+
+
+@pytest.mark.parametrize("size", [0, 1, 221, 222, 223, 5000])
+# Options are made for each test, so that no store is shared between them
+@pytest.mark.parametrize("options", [dict, lambda: {"chunk_size": 180},
+                                     lambda: {"inline_threshold": 64},
+                                     lambda: {"chunk_store": ChunkStore(max_bytes=1024)}],
+                         ids=["default", "chunk_size", "inline_threshold", "chunk_store"])
+def test_simulator_sign_tx(size, options):
+    # Accepts START_INLINE, for the inline_threshold case
+    device = SimulatedDevice(inline_params=True)
+    client = Client(device, use_block_protocol=True, **options())
+    transaction = bytes(range(256)) * (size // 256) + bytes(range(size % 256))
+
+    _, public_key, _, _ = client.get_public_key(path=PATH)
+    assert public_key == device.public_key(PATH)
+
+    signature = client.sign_tx(path=PATH, transaction=transaction)
+    assert check_signature_validity(public_key, signature, transaction)
+    assert client.sign_tx(path=PATH, transaction=io.BytesIO(transaction)) == signature
+
+
+def test_simulator_inline_params_save_round_trips():
+    # The threshold is on the parameter, a 13 byte path here, without the
+    # hash of the next block, which is not sent
+    transaction = b"small tx"
+    exchanges = {}
+    for inline_threshold in [0, 16]:
+        device = SimulatedDevice(inline_params=True)
+        client = Client(device, use_block_protocol=True, inline_threshold=inline_threshold)
+        sent = []
+        exchange = device.exchange
+        def recording_exchange(*args, **kwargs):
+            sent.append(bytes(kwargs["data"]))
+            return exchange(*args, **kwargs)
+        device.exchange = recording_exchange
+
+        client.get_public_key(path=PATH)
+        signature = client.sign_tx(path=PATH, transaction=transaction)
+        assert check_signature_validity(device.public_key(PATH), signature, transaction)
+        exchanges[inline_threshold] = len(sent)
+        if inline_threshold:
+            assert sent[0] == bytes([HostToLedger.START_INLINE, InlineEntry.DATA, 13]) \
+                + pack_derivation_path(PATH)
+    # One GET_CHUNK saved for the path, and two for the transaction and path
+    assert exchanges == {0: 2 + 3, 16: 1 + 1}
+
+    # The app is not probed: without the extension, the call is rejected
+    device = SimulatedDevice()
+    client = Client(device, use_block_protocol=True, inline_threshold=16)
+    with pytest.raises(ExceptionRAPDU):
+        client.get_public_key(path=PATH)
+    assert device.exchanges == 1
+
+
+def test_simulator_blind_sign_disabled():
+    client = Client(SimulatedDevice(blind_sign=False), use_block_protocol=True)
+    with pytest.raises(ExceptionRAPDU) as e:
+        client.sign_tx(path=PATH, transaction=b"smalltx")
+    assert e.value.status == Status.NOT_SUPPORTED
+
+
+def test_simulator_async_client(monkeypatch):
+    device = SimulatedDevice()
+    # Hashing the parameters and the exchanges stay off the event loop
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="client")
+    threads = set()
+    real_link = async_client.link_parameters
+
+    def link_parameters(*args):
+        threads.add(threading.current_thread().name)
+        return real_link(*args)
+    monkeypatch.setattr(async_client, "link_parameters", link_parameters)
+
+    async def sign():
+        client = AsyncClient(device, use_block_protocol=True, executor=executor)
+        return await client.sign_tx(PATH, b"async tx")
+
+    with executor:
+        signature = asyncio.run(sign())
+    assert check_signature_validity(device.public_key(PATH), signature, b"async tx")
+    assert threads == {"client_0"}
+
+
+def test_simulator_streamed_result():
+    # Responses of 40 bytes split the signature over RESULT_ACCUMULATING
+    client = Client(SimulatedDevice(max_apdu_len=40), use_block_protocol=True)
+    transaction = b"streamed tx" * 100
+    fragments = list(client.sign_tx_stream(PATH, transaction))
+    assert len(fragments) == 2
+    assert b"".join(fragments) == client.sign_tx(PATH, transaction)
+
+    received = []
+    client.send_with_blocks(CLA, InsType.SIGN_TX, 0, 0,
+                            [len(transaction).to_bytes(4, "little") + transaction,
+                             pack_derivation_path(PATH)],
+                            on_result=received.append)
+    assert received == fragments
+
+
+def test_simulator_sign_many(tmp_path):
+    device = SimulatedDevice()
+    client = Client(device, use_block_protocol=True, chunk_store=ChunkStore())
+    streamed = tmp_path / "transaction.bin"
+    streamed.write_bytes(b"streamed tx" * 100)
+    transactions = [b"tx %d" % i * (i + 1) for i in range(10)] + [streamed]
+
+    signatures = list(client.sign_many(PATH, iter(transactions)))
+    assert signatures == [client.sign_tx(PATH, transaction) for transaction in transactions]
+
+    # Stopping early releases the transaction prepared ahead
+    for _ in client.sign_many(PATH, transactions):
+        break
+    assert not client.chunk_store._pins
+
+
+def test_simulator_sign_many_bounded_memory():
+    client = Client(SimulatedDevice(), use_block_protocol=True)
+    transactions = (bytes([i]) * 20_000 for i in range(100))
+    tracemalloc.start()
+    try:
+        for _ in client.sign_many(PATH, transactions):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # 2 MB were signed, with about 2 transactions held at a time
+    assert peak < 500_000
@@ -0,0 +1,67 @@
+from io import BytesIO
+from pathlib import Path
+from types import SimpleNamespace
+
+from PIL import Image
+
+import snapshot_manifest
+
+GOLDEN = snapshot_manifest.SNAPSHOTS / "nanosp" / "test_app_mainmenu" / "00000.png"
+
+
+# The golden snapshots must be committed along with their manifest entries:
+# run `python snapshot_manifest.py update` after a golden run
+def test_snapshot_manifest_up_to_date():
+    assert snapshot_manifest.verify() == []
+
+
+def test_snapshot_manifest_comparison():
+    full_comparisons = []
+    def full_comparison(golden, snap, **crop):
+        full_comparisons.append(golden)
+        return False
+    comparison = snapshot_manifest.ManifestComparison(snapshot_manifest.load(), full_comparison)
+
+    assert comparison(str(GOLDEN), BytesIO(GOLDEN.read_bytes()))
+    assert full_comparisons == []
+
+    with Image.open(GOLDEN) as image:
+        changed = image.copy()
+    changed.putpixel((0, 0), (255, 0, 0))
+    snap = BytesIO()
+    changed.save(snap, format="PNG")
+    assert not comparison(str(GOLDEN), snap)
+    assert full_comparisons == [str(GOLDEN)]
+
+
+def test_snapshot_manifest_in_memory_screenshots():
+    # ragger compares two in-memory screenshots when waiting for the screen
+    # to change, which must not go through the manifest
+    full_comparisons = []
+    def full_comparison(golden, snap, **crop):
+        full_comparisons.append(golden)
+        return True
+    comparison = snapshot_manifest.ManifestComparison(snapshot_manifest.load(), full_comparison)
+    golden = BytesIO(GOLDEN.read_bytes())
+    assert comparison(golden, BytesIO(GOLDEN.read_bytes()))
+    assert full_comparisons == [golden]
+
+    snapshot_manifest.install()
+    from ragger.backend import speculos
+    assert speculos.screenshot_equal(BytesIO(GOLDEN.read_bytes()), BytesIO(GOLDEN.read_bytes()))
+
+
+def test_snapshot_manifest_installed_comparison(tmp_path):
+    comparison = snapshot_manifest.install()
+    from ragger.backend.speculos import SpeculosBackend
+
+    def save(snap, path):
+        Path(path).write_bytes(snap.read())
+    screen = GOLDEN.read_bytes()
+    backend = SimpleNamespace(_client=SimpleNamespace(get_screenshot=lambda: screen),
+                              _save_screen_snapshot=save)
+    hash_matches = comparison.hash_matches
+    assert SpeculosBackend.compare_screen_with_snapshot(backend, GOLDEN,
+                                                        tmp_snap_path=tmp_path / "00000.png")
+    assert comparison.hash_matches == hash_matches + 1
+    assert (tmp_path / "00000.png").read_bytes() == GOLDEN.read_bytes()
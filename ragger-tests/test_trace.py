@@ -0,0 +1,39 @@
+import pytest
+
+from application_client.client import CLA, Client, InsType
+from application_client.simulator import SimulatedDevice
+from application_client.trace import RecordingBackend, ReplayBackend, read_trace
+from ragger.error import ExceptionRAPDU
+
+PATH = "m/44'/535348'/0'"
+
+
+def test_trace_replay(tmp_path):
+    trace = tmp_path / "session.trace"
+    transaction = b"recorded tx" * 100
+    with RecordingBackend(SimulatedDevice(), trace) as backend:
+        client = Client(backend, use_block_protocol=True)
+        signature = client.sign_tx(path=PATH, transaction=transaction)
+        # Readable before the backend is closed
+        assert len(list(read_trace(trace))) == backend.exchanges
+        with pytest.raises(ExceptionRAPDU):
+            client.sign_tx(path="m/44'/1'/0'", transaction=transaction)
+
+    replay = ReplayBackend(trace)
+    client = Client(replay, use_block_protocol=True)
+    assert client.sign_tx(path=PATH, transaction=transaction) == signature
+    with pytest.raises(ExceptionRAPDU):
+        client.sign_tx(path="m/44'/1'/0'", transaction=transaction)
+    assert replay.done
+
+
+def test_trace_transport_error(tmp_path):
+    class Disconnected:
+        def exchange(self, *args, **kwargs):
+            raise ConnectionError("device disconnected")
+
+    trace = tmp_path / "session.trace"
+    with RecordingBackend(Disconnected(), trace) as backend:
+        with pytest.raises(ConnectionError):
+            backend.exchange(CLA, InsType.GET_VERSION)
+    assert ReplayBackend(trace).done
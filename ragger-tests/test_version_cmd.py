@@ -1,6 +1,8 @@
+import asyncio
 import tomli
 from pathlib import Path
 from application_client.client import Client
+from application_client.async_client import AsyncClient
 
 # In this test we check the behavior of the device when asked to provide the app version
 def test_version(backend):
@@ -21,3 +23,11 @@ def test_version(backend):
     # Send the GET_VERSION instruction
     response = client.get_app_and_version()
     assert response == (version)
+
+# Same check, through the asyncio client
+def test_version_async(backend):
+    client = AsyncClient(backend, use_block_protocol=True)
+    (major, minor, patch), name = asyncio.run(client.get_app_and_version())
+    assert name == "alamgu example"
+    version, _ = Client(backend, use_block_protocol=True).get_app_and_version()
+    assert (major, minor, patch) == version
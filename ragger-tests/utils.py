@@ -6,19 +6,21 @@ from pathlib import Path
 from hashlib import blake2b
 from hashlib import sha256
 
-from ecdsa.curves import Ed25519
 from ecdsa.keys import VerifyingKey
+from ragger.navigator import NavIns, NavInsID
+
+from signature_verifier import default_verifier
 
 
 ROOT_SCREENSHOT_PATH = Path(__file__).parent.resolve()
 
 
 # Check if a signature of a given message is valid
+#
+# Decoded public keys are cached; to check many signatures at once, see
+# signature_verifier.verify_batch
 def check_signature_validity(public_key: bytes, signature: bytes, message: bytes) -> bool:
-    pk: VerifyingKey = VerifyingKey.from_string(
-        public_key,
-        curve=Ed25519,
-    )
+    pk: VerifyingKey = default_verifier.verifying_key(public_key)
     hash_object = blake2b(digest_size=32)
     hash_object.update(message)
     return pk.verify(
@@ -26,37 +28,123 @@ def check_signature_validity(public_key: bytes, signature: bytes, message: bytes
         data=hash_object.digest()
     )
 
+# Worker threads running the APDU and navigation tasks, shared by the tests of
+# a session and shut down by the session_task_pool fixture
+_task_pool = None
+
+
+def task_pool() -> concurrent.futures.ThreadPoolExecutor:
+    global _task_pool
+    if _task_pool is None:
+        _task_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2,
+                                                           thread_name_prefix="apdu-nav")
+    return _task_pool
+
+
+def shutdown_task_pool(wait: bool = True) -> None:
+    global _task_pool
+    if _task_pool is not None:
+        _task_pool.shutdown(wait=wait, cancel_futures=True)
+        _task_pool = None
+
+
+# Waits until the screen changes from the one the backend last saw, which is
+# the first review screen once the APDU is sent: the caller must bring the
+# backend's reference screen up to date first. Returns False if the APDU task
+# finished first, e.g. on an error before any review.
+def wait_for_review(backend, future_apdu, timeout):
+    deadline = time.monotonic() + timeout
+    while not future_apdu.done():
+        try:
+            backend.wait_for_screen_change(timeout=min(0.5, max(0.1, deadline - time.monotonic())))
+            return True
+        except TimeoutError:
+            if time.monotonic() > deadline:
+                raise
+    return False
+
+
 # Run APDU and navigation tasks concurrently
-def run_apdu_and_nav_tasks_concurrently(apdu_task, nav_task, check_result):
-    executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+#
+# With a backend, nav_task starts as soon as the device shows a new screen, so
+# its first instruction must not wait for a screen change. Without one, it
+# starts right away, and must wait for the review to show itself.
+#
+# Reviews start from the home screen. The backend's reference screen may be
+# older than that, as navigations which do not wait for their last screen
+# (such as toggle_blind_sign on Stax and Flex) leave it behind, so it is
+# brought up to the home screen before the APDU is sent.
+def run_apdu_and_nav_tasks_concurrently(apdu_task, nav_task, check_result, backend=None,
+                                        timeout=30):
+    executor = task_pool()
+    if backend is not None:
+        backend.wait_for_home_screen(timeout=timeout)
     future_apdu = executor.submit(apdu_task)
 
-    # Submit nav_task after a delay
-    future_nav = executor.submit(lambda: time.sleep(2) or nav_task())
-
-    try:
-        # Wait for both futures to complete
-        done, not_done = concurrent.futures.wait([future_apdu, future_nav], timeout=30, return_when=concurrent.futures.FIRST_EXCEPTION)
-        print("DEBUG: run_apdu_and_nav_tasks_concurrently, after wait")
-
-        # Check if apdu_task completed successfully
-        if future_apdu.done():
-            result = future_apdu.result()
-            check_result(result)
-        else:
-            for future in done:
-                try:
-                    future.result()
-                except Exception as e:
-                    raise
-
-    except concurrent.futures.TimeoutError:
-        print("DEBUG: run_apdu_and_nav_tasks_concurrently, TimeoutError")
-        # Cancel both tasks
-        future_apdu.cancel()
-        future_nav.cancel()
+    if backend is None:
+        future_nav = executor.submit(nav_task)
+    else:
+        future_nav = executor.submit(
+            lambda: wait_for_review(backend, future_apdu, timeout) and nav_task())
+
+    # Wait for both futures to complete
+    done, not_done = concurrent.futures.wait([future_apdu, future_nav], timeout=timeout,
+                                             return_when=concurrent.futures.FIRST_EXCEPTION)
+
+    # Check if apdu_task completed successfully
+    if future_apdu.done():
+        result = future_apdu.result()
+        check_result(result)
+    else:
+        # The APDU task is stuck, so the next test gets new threads
+        shutdown_task_pool(wait=False)
+        for future in done:
+            future.result()
         pytest.fail("Timeout")
 
-    except Exception as e:
-        print("DEBUG: run_apdu_and_nav_tasks_concurrently, Exception")
-        raise
+
+def toggle_blind_sign(device, navigator):
+    if device.is_nano:
+        navigator.navigate(
+            instructions=[NavInsID.RIGHT_CLICK, NavInsID.RIGHT_CLICK, NavInsID.BOTH_CLICK,
+                          NavInsID.BOTH_CLICK, NavInsID.RIGHT_CLICK, NavInsID.BOTH_CLICK,
+                          NavInsID.LEFT_CLICK, NavInsID.LEFT_CLICK]
+            , timeout=10
+            , screen_change_before_first_instruction=False
+        )
+    else:
+        navigator.navigate([NavInsID.USE_CASE_HOME_SETTINGS,
+                            NavIns(NavInsID.TOUCH, (200, 113)),
+                            NavInsID.USE_CASE_SUB_SETTINGS_EXIT],
+                            timeout=10,
+                            screen_change_before_first_instruction=False,
+                            screen_change_after_last_instruction=False)
+
+
+# The settings of the app on a backend shared by several tests. Each test
+# starts with the defaults, as the backend is restarted after a test which
+# changed them (see reset_warm_backend in conftest.py), and sets those it
+# depends on: setting one to the value it already has costs nothing.
+class AppSettings:
+    def __init__(self, device, navigator):
+        self.device = device
+        self.navigator = navigator
+        self.reset()
+
+    # The settings of a freshly started app
+    def reset(self):
+        self._blind_sign = False
+
+    def at_defaults(self):
+        return not self._blind_sign
+
+    @property
+    def blind_sign(self):
+        return self._blind_sign
+
+    @blind_sign.setter
+    def blind_sign(self, enabled):
+        if enabled != self._blind_sign:
+            toggle_blind_sign(self.device, self.navigator)
+            self._blind_sign = enabled
+
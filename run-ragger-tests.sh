@@ -2,15 +2,92 @@
 
 set -eu
 
-for device in nanosplus nanox flex stax
+# Usage: run-ragger-tests.sh [--parallel [WORKERS]] [pytest args...]
+#
+# By default each device is built and tested in turn. With --parallel, each
+# device is built once (skipped when its sources are unchanged since the last
+# build), then all devices are tested at the same time, with their tests
+# sharded over WORKERS pytest-xdist workers (default 2) each running its own
+# Speculos on its own ports. The reports are merged into reports/report.xml.
+
+devices="nanosplus nanox flex stax"
+parallel=
+workers=2
+if [ "${1:-}" = "--parallel" ]
+then
+    parallel=1
+    shift
+    if [[ "${1:-}" =~ ^[0-9]+$ ]]
+    then
+        workers=$1
+        shift
+    fi
+fi
+
+if [ -z "$parallel" ]
+then
+    for device in $devices
+    do
+        export DEVICE=$device
+        export pytest_args="$@"
+        nix-shell -A $DEVICE.rustShell --run " \
+          set -x
+          cd rust-app; \
+          cargo build --release --target=\$TARGET_JSON; \
+          cd ..; \
+          pytest ragger-tests --tb=short -v --device ${DEVICE/nanosplus/nanosp} ${pytest_args};
+        "
+    done
+    exit 0
+fi
+
+# Everything the app build depends on, so that an unchanged device is not
+# rebuilt
+sources_hash() {
+    find rust-app -path rust-app/target -prune -o -type f -print0 \
+        | sort -z | xargs -0 sha256sum | sha256sum | cut -d' ' -f1
+}
+
+hash=$(sources_hash)
+for device in $devices
 do
-    export DEVICE=$device
-    export pytest_args="$@"
-    nix-shell -A $DEVICE.rustShell --run " \
+    stamp=rust-app/target/.ragger-build-$device
+    if [ -f $stamp ] && [ "$(cat $stamp)" = "$hash" ]
+    then
+        echo "$device: up to date"
+        continue
+    fi
+    nix-shell -A $device.rustShell --run " \
       set -x
       cd rust-app; \
-      cargo build --release --target=\$TARGET_JSON; \
-      cd ..; \
-      pytest ragger-tests --tb=short -v --device ${DEVICE/nanosplus/nanosp} ${pytest_args};
+      cargo build --release --target=\$TARGET_JSON;
     "
+    mkdir -p rust-app/target
+    echo $hash > $stamp
+done
+
+reports=reports
+rm -rf $reports ragger-tests/snapshots-tmp
+mkdir -p $reports
+
+# Each device gets its own range of Speculos ports, split between its
+# workers by the ragger-tests conftest
+port_base=20000
+pids=
+for device in $devices
+do
+    name=${device/nanosplus/nanosp}
+    SPECULOS_PORT_BASE=$port_base nix-shell -A $device.rustShell --run " \
+      pytest ragger-tests --tb=short -v --device $name -n $workers \
+        --junitxml=$reports/$name.xml $*
+    " > $reports/$name.log 2>&1 &
+    pids="$pids $!"
+    port_base=$((port_base + 2 * workers + 10))
+done
+
+for pid in $pids
+do
+    wait $pid || true
 done
+
+python3 ragger-tests/merge_reports.py --output $reports/report.xml $reports/*.xml